@@ -0,0 +1,47 @@
+"""Reproduce the Admin tab's batch-valuation benchmark from the command line.
+
+    python benchmarks/batch_valuation.py --rows 100000 --loop 500
+
+Run from the project root: it needs house_model.pkl and model_columns.pkl there. The
+app is executed in bare Streamlit mode against a throwaway SQLite file, so nothing is
+written to the real database.
+"""
+import argparse
+import os
+import runpy
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=10_000, help="rows scored by the batch path")
+    ap.add_argument("--loop", type=int, default=500, help="rows scored one by one")
+    ap.add_argument("--repeat", type=int, default=3, help="runs; the best rates are reported")
+    args = ap.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    app = runpy.run_path(os.path.join(ROOT, "proproperty_ai.py"), run_name="proproperty_ai")
+    if app["model"] is None:
+        sys.exit("house_model.pkl / model_columns.pkl not found in the current directory")
+
+    df    = app["synthetic_properties"](args.loop)
+    loop  = np.array([app["model"].predict(app["build_input"](r))[0] for r in df.to_dict("records")])
+    batch = app["predict_batch"](df)["predicted_price"].to_numpy()
+    print(f"model {app['MODEL_VERSION']}: batch matches per-row loop: {np.allclose(loop, batch)}")
+
+    runs = [app["benchmark_batch"](args.rows, args.loop) for _ in range(args.repeat)]
+    loop_rate  = max(r["loop_rows_per_s"] for r in runs)
+    batch_rate = max(r["batch_rows_per_s"] for r in runs)
+    print(f"per-row loop : {loop_rate:>12,.0f} rows/s  ({args.loop:,} rows)")
+    print(f"batch        : {batch_rate:>12,.0f} rows/s  ({args.rows:,} rows)")
+    print(f"speedup      : {batch_rate / loop_rate:>12,.1f}x")
+    app["prediction_writer"].close()
+
+
+if __name__ == "__main__":
+    main()
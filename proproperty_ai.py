@@ -5,15 +5,26 @@
 #  Stack: Python · Streamlit · Random Forest · SQLAlchemy · Plotly
 # ================================================================
 
-import os, time, hashlib, joblib, requests, base64, sqlite3
-import pandas as pd
-import plotly.express as px
-import folium
+import time
+_IMPORT_T0 = time.perf_counter()
+import os, io, re, csv, ipaddress, hmac, json, queue, atexit, base64, shutil, secrets, hashlib, functools, importlib, logging, unicodedata, joblib, requests, sqlite3, threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+import numpy as np
 import streamlit as st
-from datetime import datetime
-from sqlalchemy import create_engine, text
-from streamlit_folium import st_folium
-from PIL import Image
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from sqlalchemy import Column, Integer, MetaData, Table, bindparam, create_engine, event, insert, text
+from sqlalchemy.exc import DisconnectionError, IntegrityError, OperationalError, SQLAlchemyError, TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+from dotenv import load_dotenv
+
+log = logging.getLogger("proproperty")
+if os.getenv("LOAD_DOTENV") == "1":   # opt-in: a stray .env must not silently point a dev box at a shared DB
+    load_dotenv()
 
 try:
     from streamlit_js_eval import get_geolocation
@@ -21,6 +32,48 @@ try:
 except ImportError:
     GPS_AVAILABLE = False
 
+# ── STARTUP PROFILE ──────────────────────────────────────────────
+# Cold-start timings for this process: eager imports, each init phase, and each lazily
+# imported module the first time a tab touches it. Reruns never overwrite the first value.
+@st.cache_resource(show_spinner=False)
+def startup_profile():
+    return {"phases": {"imports": time.perf_counter() - _IMPORT_T0}, "imports": {}}
+
+
+STARTUP = startup_profile()
+
+
+@contextmanager
+def startup_phase(name):
+    t0 = time.perf_counter()
+    yield
+    STARTUP["phases"].setdefault(name, time.perf_counter() - t0)
+
+
+class LazyModule:
+    """Stands in for a heavy module; imports it on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._mod  = None
+
+    def __getattr__(self, attr):
+        if self._mod is None:
+            t0 = time.perf_counter()
+            self._mod = importlib.import_module(self._name)
+            STARTUP["imports"].setdefault(self._name, time.perf_counter() - t0)
+        return getattr(self._mod, attr)
+
+
+# Charting, mapping, imaging and dataframes are only needed past the login screen.
+pd               = LazyModule("pandas")
+px               = LazyModule("plotly.express")
+go               = LazyModule("plotly.graph_objects")
+folium           = LazyModule("folium")
+streamlit_folium = LazyModule("streamlit_folium")
+Image            = LazyModule("PIL.Image")
+ImageOps         = LazyModule("PIL.ImageOps")
+
 # ── PAGE CONFIG ──────────────────────────────────────────────────
 st.set_page_config(
     page_title="House price prediction",
@@ -30,6 +83,8 @@ st.set_page_config(
 )
 
 #  GLOBAL STYLES — Bold, vibrant, fully mobile-first
+#  Split in two: the login screen only gets the base sheet; the dashboard widgets
+#  (section nav, selects, metrics, uploader, charts) are styled once the user is in.
 st.markdown("""
 <style>
 @import url('https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@400;500;600;700;800;900&display=swap');
@@ -94,45 +149,6 @@ h1, h2, h3, h4, h5, h6 { color: #0d1f3c !important; -webkit-text-fill-color: #0d
     word-break: break-word !important;
 }
 
-/* ── TABS ── */
-.stTabs [data-baseweb="tab-list"] {
-    background: white !important;
-    border-radius: 14px !important;
-    padding: 5px !important;
-    border: 1.5px solid #dde3f5 !important;
-    gap: 3px !important;
-    overflow-x: auto !important;
-    -webkit-overflow-scrolling: touch !important;
-    scrollbar-width: none !important;
-    flex-wrap: nowrap !important;
-    box-shadow: 0 2px 12px rgba(22,72,255,0.08) !important;
-}
-.stTabs [data-baseweb="tab-list"]::-webkit-scrollbar { display: none; }
-.stTabs [data-baseweb="tab"] {
-    border-radius: 10px !important;
-    font-size: 13px !important;
-    font-weight: 700 !important;
-    color: #5a6a8a !important;
-    -webkit-text-fill-color: #5a6a8a !important;
-    padding: 10px 16px !important;
-    background: transparent !important;
-    white-space: nowrap !important;
-    min-width: fit-content !important;
-    transition: all 0.18s !important;
-}
-.stTabs [aria-selected="true"] {
-    background: #1648ff !important;
-    box-shadow: 0 4px 14px rgba(22,72,255,0.35) !important;
-    color: white !important;
-    -webkit-text-fill-color: white !important;
-}
-.stTabs [aria-selected="true"] p,
-.stTabs [aria-selected="true"] span,
-.stTabs [aria-selected="true"] div {
-    color: white !important;
-    -webkit-text-fill-color: white !important;
-}
-
 /* ── BUTTONS ── */
 .stButton > button {
     background: linear-gradient(135deg, #1648ff, #2d6cff) !important;
@@ -182,6 +198,90 @@ h1, h2, h3, h4, h5, h6 { color: #0d1f3c !important; -webkit-text-fill-color: #0d
     box-shadow: 0 0 0 3px rgba(22,72,255,0.12) !important;
 }
 
+/* ── CAPTIONS ── */
+[data-testid="stCaptionContainer"] p,
+.stCaption { color: #5a6a8a !important; -webkit-text-fill-color: #5a6a8a !important; font-size: 13px !important; }
+
+/* ── ALERTS ── */
+[data-testid="stAlert"] { border-radius: 12px !important; }
+[data-testid="stAlert"] p { color: inherit !important; -webkit-text-fill-color: inherit !important; }
+
+/* ── HTML inline divs with white text (result cards, banners) ── */
+/* Allow explicitly styled divs to keep their own colors */
+div[style*="color:white"] * { color: white !important; -webkit-text-fill-color: white !important; }
+div[style*="color: white"] * { color: white !important; -webkit-text-fill-color: white !important; }
+div[style*="color:rgba(255"] * { color: inherit !important; -webkit-text-fill-color: inherit !important; }
+
+/* ── COLUMNS — desktop ── */
+[data-testid="column"] {
+    min-width: 0 !important;
+    width: auto !important;
+    flex: 1 1 auto !important;
+}
+
+/* ── MOBILE 768px ── */
+@media (max-width: 768px) {
+    [data-testid="column"] {
+        width: 100% !important; flex: 1 1 100% !important;
+        min-width: 100% !important;
+        padding-left: 0 !important; padding-right: 0 !important;
+    }
+    .main .block-container {
+        padding-left: 0.6rem !important; padding-right: 0.6rem !important;
+        padding-top: 0.5rem !important;
+    }
+    .stTextInput input, .stNumberInput input { font-size: 16px !important; min-height: 48px !important; }
+    .stButton > button { min-height: 52px !important; }
+}
+
+/* ── SMALL PHONES 480px ── */
+@media (max-width: 480px) {
+    .main .block-container { padding-left: 0.3rem !important; padding-right: 0.3rem !important; }
+}
+</style>
+""", unsafe_allow_html=True)
+
+DASHBOARD_CSS = """
+<style>
+/* ── SECTION NAV — horizontal radio styled as the tab bar ── */
+.st-key-active_tab [role="radiogroup"] {
+    background: white !important;
+    border-radius: 14px !important;
+    padding: 5px !important;
+    border: 1.5px solid #dde3f5 !important;
+    gap: 3px !important;
+    overflow-x: auto !important;
+    -webkit-overflow-scrolling: touch !important;
+    scrollbar-width: none !important;
+    flex-wrap: nowrap !important;
+    box-shadow: 0 2px 12px rgba(22,72,255,0.08) !important;
+}
+.st-key-active_tab [role="radiogroup"]::-webkit-scrollbar { display: none; }
+.st-key-active_tab [role="radiogroup"] label {
+    border-radius: 10px !important;
+    margin: 0 !important;
+    padding: 10px 16px !important;
+    background: transparent !important;
+    white-space: nowrap !important;
+    min-width: fit-content !important;
+    transition: all 0.18s !important;
+}
+.st-key-active_tab [role="radiogroup"] label > div:first-child { display: none !important; }
+.st-key-active_tab [role="radiogroup"] label p {
+    font-size: 13px !important;
+    font-weight: 700 !important;
+    color: #5a6a8a !important;
+    -webkit-text-fill-color: #5a6a8a !important;
+}
+.st-key-active_tab [role="radiogroup"] label:has(input:checked) {
+    background: #1648ff !important;
+    box-shadow: 0 4px 14px rgba(22,72,255,0.35) !important;
+}
+.st-key-active_tab [role="radiogroup"] label:has(input:checked) p {
+    color: white !important;
+    -webkit-text-fill-color: white !important;
+}
+
 /* ── SELECTBOX — FIXED: only target the single visible control, not all nested divs ── */
 /* Control wrapper */
 .stSelectbox [data-baseweb="select"] > div:first-child {
@@ -273,10 +373,6 @@ h1, h2, h3, h4, h5, h6 { color: #0d1f3c !important; -webkit-text-fill-color: #0d
 [data-testid="stMetricValue"] { color: #1648ff !important; -webkit-text-fill-color: #1648ff !important; font-size: 22px !important; font-weight: 900 !important; }
 [data-testid="stMetricDelta"] { color: #00c896 !important; -webkit-text-fill-color: #00c896 !important; font-size: 11px !important; }
 
-/* ── CAPTIONS ── */
-[data-testid="stCaptionContainer"] p,
-.stCaption { color: #5a6a8a !important; -webkit-text-fill-color: #5a6a8a !important; font-size: 13px !important; }
-
 /* ── PROGRESS BAR ── */
 .stProgress > div > div {
     background: linear-gradient(90deg, #00c896, #1648ff, #ffb300, #ff3d6b) !important;
@@ -325,39 +421,12 @@ h1, h2, h3, h4, h5, h6 { color: #0d1f3c !important; -webkit-text-fill-color: #0d
 .js-plotly-plot, .plotly { max-width: 100% !important; overflow: hidden !important; }
 .stFolium iframe { width: 100% !important; border-radius: 18px !important; }
 
-/* ── ALERTS ── */
-[data-testid="stAlert"] { border-radius: 12px !important; }
-[data-testid="stAlert"] p { color: inherit !important; -webkit-text-fill-color: inherit !important; }
-
-/* ── HTML inline divs with white text (result cards, banners) ── */
-/* Allow explicitly styled divs to keep their own colors */
-div[style*="color:white"] * { color: white !important; -webkit-text-fill-color: white !important; }
-div[style*="color: white"] * { color: white !important; -webkit-text-fill-color: white !important; }
-div[style*="color:rgba(255"] * { color: inherit !important; -webkit-text-fill-color: inherit !important; }
-
-/* ── COLUMNS — desktop ── */
-[data-testid="column"] {
-    min-width: 0 !important;
-    width: auto !important;
-    flex: 1 1 auto !important;
-}
-
 /* ── MOBILE 768px ── */
 @media (max-width: 768px) {
-    [data-testid="column"] {
-        width: 100% !important; flex: 1 1 100% !important;
-        min-width: 100% !important;
-        padding-left: 0 !important; padding-right: 0 !important;
-    }
-    .main .block-container {
-        padding-left: 0.6rem !important; padding-right: 0.6rem !important;
-        padding-top: 0.5rem !important;
-    }
-    .stTextInput input, .stNumberInput input { font-size: 16px !important; min-height: 48px !important; }
-    .stTabs [data-baseweb="tab"] { font-size: 11px !important; padding: 8px 10px !important; }
+    .st-key-active_tab [role="radiogroup"] label { padding: 8px 10px !important; }
+    .st-key-active_tab [role="radiogroup"] label p { font-size: 11px !important; }
     [data-testid="metric-container"] { padding: 12px 10px !important; margin-bottom: 8px !important; }
     [data-testid="stMetricValue"] { font-size: 18px !important; }
-    .stButton > button { min-height: 52px !important; }
     .stFolium iframe { min-height: 280px !important; }
     /* Mobile toggle label enforcement */
     [data-testid="stToggleLabel"],
@@ -371,35 +440,99 @@ div[style*="color:rgba(255"] * { color: inherit !important; -webkit-text-fill-co
 
 /* ── SMALL PHONES 480px ── */
 @media (max-width: 480px) {
-    .main .block-container { padding-left: 0.3rem !important; padding-right: 0.3rem !important; }
     [data-testid="stMetricValue"] { font-size: 16px !important; }
-    .stTabs [data-baseweb="tab"] { font-size: 10px !important; padding: 7px 8px !important; }
+    .st-key-active_tab [role="radiogroup"] label { padding: 7px 8px !important; }
+    .st-key-active_tab [role="radiogroup"] label p { font-size: 10px !important; }
 }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 # ── MEDIA FOLDER & DATABASE ──────────────────────────────────────
-os.makedirs("property_media", exist_ok=True)
-DB_PATH = "/tmp/proproperty.db"
+MEDIA_DIR = "property_media"
+os.makedirs(MEDIA_DIR, exist_ok=True)
+# Thumbnails live under ./static so Streamlit serves them (server.enableStaticServing).
+THUMB_DIR  = os.path.join("static", "thumbs")
+THUMB_URL  = "/app/static/thumbs"
+THUMB_SIZE = (320, 320)
+os.makedirs(THUMB_DIR, exist_ok=True)
+# Comma-separated usernames that see the Admin tab; unset or empty means no one.
+ADMIN_USERS = {u.strip() for u in os.getenv("ADMIN_USERS", "").split(",") if u.strip()}
+
+# ── STORAGE ──────────────────────────────────────────────────────
+# DATABASE_URL picks the backend: sqlite:///path (default) or postgresql://… .
+# Either way connections come from a pool, one per checkout, never shared between
+# threads at the same time. SQLite runs in WAL mode so readers don't block the writer.
+DATABASE_URL    = os.getenv("DATABASE_URL", "sqlite:///proproperty.db")
+LEGACY_DB_PATH  = os.getenv("LEGACY_DB_PATH", "/tmp/proproperty.db")   # where releases before DATABASE_URL kept their data
+DB_POOL_SIZE    = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_BUSY_MS      = int(os.getenv("DB_BUSY_MS", "5000"))   # how long a SQLite writer waits for the lock
+
+
+def _sqlite_pragmas(dbapi_con, _record):
+    cur = dbapi_con.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")        # durable at checkpoints; safe with WAL
+    cur.execute(f"PRAGMA busy_timeout={DB_BUSY_MS}")
+    cur.close()
+
+
+def _adopt_legacy_sqlite():
+    """On the first run with the default URL, carry the old /tmp database over (via the
+    SQLite backup API, so a live WAL is copied consistently) instead of starting empty."""
+    if "DATABASE_URL" in os.environ or os.path.exists("proproperty.db") or not os.path.exists(LEGACY_DB_PATH):
+        return
+    src, dst = sqlite3.connect(LEGACY_DB_PATH), sqlite3.connect("proproperty.db")
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+    log.info("storage: copied %s to ./proproperty.db", LEGACY_DB_PATH)
+
+
 @st.cache_resource
 def get_engine():
-    from sqlalchemy.pool import StaticPool
-    return create_engine(
-        f"sqlite:///{DB_PATH}",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
+    # Bare postgres:// / postgresql:// URLs → psycopg2 (requirements.txt); SQLAlchemy 2.1 would pick psycopg 3
+    url = re.sub(r"^postgres(ql)?://", "postgresql+psycopg2://", DATABASE_URL)
+    pool = dict(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True)
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_recycle=1800, **pool)
+    _adopt_legacy_sqlite()
+    eng = create_engine(url, connect_args={"check_same_thread": False, "timeout": DB_BUSY_MS / 1000},
+                        poolclass=QueuePool, **pool)
+    event.listen(eng, "connect", _sqlite_pragmas)
+    return eng
 
 engine = get_engine()
 
 
+def _ddl(q):
+    """Schema statements are written for SQLite; translate the few types PostgreSQL spells differently."""
+    if engine.dialect.name == "postgresql":
+        q = q.replace("INTEGER PRIMARY KEY AUTOINCREMENT", "BIGSERIAL PRIMARY KEY")
+        q = re.sub(r"\bREAL\b", "DOUBLE PRECISION", q)
+    return q
+
+
+MIGRATION_LOCK_ID = 0x70726f70   # pg_advisory_xact_lock key shared by every app process
+
+
+@st.cache_resource
 def init_db():
+    # Schema setup is one transaction under a lock, so workers starting together apply each
+    # migration once: BEGIN IMMEDIATE takes SQLite's write lock up front (pysqlite would
+    # otherwise run DDL outside any transaction); PostgreSQL waits on an advisory lock.
     with engine.connect() as con:
-        con.execute(text("""
+        if engine.dialect.name == "sqlite":
+            con.exec_driver_sql("BEGIN IMMEDIATE")
+        elif engine.dialect.name == "postgresql":
+            con.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": MIGRATION_LOCK_ID})
+        con.execute(text(_ddl("""
             CREATE TABLE IF NOT EXISTS users (
                 username TEXT PRIMARY KEY, password TEXT NOT NULL, created TEXT)
-        """))
-        con.execute(text("""
+        """)))
+        con.execute(text(_ddl("""
             CREATE TABLE IF NOT EXISTS predictions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 username TEXT, country TEXT, state TEXT, city TEXT, pincode TEXT,
@@ -408,47 +541,761 @@ def init_db():
                 hotwaterheating INTEGER, airconditioning INTEGER, prefarea INTEGER,
                 furnishing TEXT, predicted_price REAL, price_per_sqft REAL,
                 segment TEXT, lat REAL, lon REAL, media_paths TEXT, timestamp TEXT)
-        """))
+        """)))
+        migrate(con)
         con.commit()
 
 
-init_db()
+# ── SCHEMA MIGRATIONS ────────────────────────────────────────────
+# Append-only: (version, statements). Applied once per DB, in order.
+SCHEMA_MIGRATIONS = [
+    (1, ["CREATE INDEX IF NOT EXISTS idx_predictions_ts      ON predictions(timestamp, id)",
+         "CREATE INDEX IF NOT EXISTS idx_predictions_user    ON predictions(username)",
+         "CREATE INDEX IF NOT EXISTS idx_predictions_loc     ON predictions(state, city)",
+         "CREATE INDEX IF NOT EXISTS idx_predictions_segment ON predictions(segment)"]),
+    (2, ["CREATE INDEX IF NOT EXISTS idx_predictions_latlon  ON predictions(lat, lon)"]),
+    (3, ["CREATE TABLE IF NOT EXISTS thumbnails (media TEXT PRIMARY KEY, sha256 TEXT NOT NULL, thumb TEXT NOT NULL)"]),
+    (4, ["CREATE TABLE IF NOT EXISTS geocode_cache (key TEXT PRIMARY KEY, value TEXT, expires REAL NOT NULL)"]),
+    (5, ["CREATE TABLE IF NOT EXISTS prediction_cache (key TEXT PRIMARY KEY, price REAL NOT NULL, created REAL NOT NULL)",
+         "CREATE INDEX IF NOT EXISTS idx_prediction_cache_created ON prediction_cache(created)"]),
+    (6, ["ALTER TABLE predictions ADD COLUMN model_version TEXT"]),
+    (7, ["CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, username TEXT NOT NULL, expires REAL NOT NULL)",
+         "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires)"]),
+    (8, ["CREATE TABLE IF NOT EXISTS login_limits (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, "
+         "failures INTEGER NOT NULL, locked_until REAL NOT NULL)"]),
+    (9, ["CREATE TABLE IF NOT EXISTS media_usage (username TEXT PRIMARY KEY, bytes BIGINT NOT NULL)"]),
+    (10, ["CREATE TABLE IF NOT EXISTS media (id INTEGER PRIMARY KEY AUTOINCREMENT, prediction_id INTEGER NOT NULL, "
+          "sha256 TEXT NOT NULL, kind TEXT NOT NULL, name TEXT NOT NULL, width INTEGER, height INTEGER, "
+          "bytes BIGINT NOT NULL, thumb TEXT, created TEXT NOT NULL)",
+          "CREATE INDEX IF NOT EXISTS idx_media_prediction ON media(prediction_id, kind)",
+          "CREATE INDEX IF NOT EXISTS idx_media_sha256     ON media(sha256)",
+          "CREATE INDEX IF NOT EXISTS idx_predictions_media ON predictions(media_paths)",
+          "DROP TABLE IF EXISTS thumbnails"]),
+    (11, ["DELETE FROM media WHERE id NOT IN (SELECT MIN(id) FROM media GROUP BY prediction_id, sha256)",
+          "CREATE UNIQUE INDEX IF NOT EXISTS uq_media_prediction_sha ON media(prediction_id, sha256)"]),
+    (12, ["UPDATE predictions SET media_paths='' WHERE media_paths LIKE 'pending:%'",
+          "DROP INDEX IF EXISTS idx_predictions_media"]),   # media is linked by row id now
+]
+
+
+def migrate(con):
+    con.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    current = con.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    for version, statements in SCHEMA_MIGRATIONS:
+        if version <= current:
+            continue
+        for q in statements:
+            con.execute(text(_ddl(q)))
+        con.execute(text("INSERT INTO schema_version VALUES (:v)"), {"v": version})
+
+
+with startup_phase("init_db"):
+    init_db()
 
 # ── MODEL ────────────────────────────────────────────────────────
+# Worker processes share one copy of the model through the OS page cache: tree
+# ensembles are flattened into .npy arrays, anything else is re-dumped uncompressed;
+# both are opened with mmap_mode="r". MODEL_MMAP=0 falls back to a plain joblib.load.
+MODEL_MMAP          = os.getenv("MODEL_MMAP", "1") == "1"
+# The flat walk beats sklearn only on small inputs (single valuations); bigger batches
+# go to the original estimator, loaded on first use by the processes that need it.
+MODEL_FLAT_MAX_ROWS = int(os.getenv("MODEL_FLAT_MAX_ROWS", "32"))
+
+
+class FlatTreeModel:
+    """Array-backed predictor for sklearn tree regressors (DecisionTree, RandomForest,
+    ExtraTrees, GradientBoosting): all nodes of all trees in flat, mmap-able arrays,
+    evaluated level by level for every tree at once. Inputs above MODEL_FLAT_MAX_ROWS
+    rows are handed to the estimator pickled at `source`, if there is one."""
+
+    ARRAYS = ("left", "right", "feature", "threshold", "value", "roots")
+
+    def __init__(self, arrays, meta, source=None):
+        for k in self.ARRAYS:
+            setattr(self, k, arrays[k])
+        self.meta   = meta
+        self.source = source
+        self.feature_names_in_ = np.array(meta["features"], dtype=object) if meta.get("features") else None
+        self._estimator      = None
+        self._estimator_lock = threading.Lock()
+
+    def estimator(self):
+        with self._estimator_lock:
+            if self._estimator is None:
+                self._estimator = joblib.load(self.source)
+            return self._estimator
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flatten a fitted sklearn regressor, or return None if it isn't a supported kind."""
+        kind = type(model).__name__
+        if kind == "DecisionTreeRegressor":
+            trees, scale, base = [model], 1.0, 0.0
+        elif kind in ("RandomForestRegressor", "ExtraTreesRegressor"):
+            trees = list(model.estimators_)
+            scale, base = 1.0 / len(trees), 0.0
+        elif kind == "GradientBoostingRegressor":
+            init = model.init_
+            if isinstance(init, str) and init == "zero":
+                base = 0.0
+            elif hasattr(init, "constant_"):
+                base = float(np.ravel(init.constant_)[0])
+            else:
+                return None
+            trees, scale = [t for row in model.estimators_ for t in row], float(model.learning_rate)
+        else:
+            return None
+        parts, roots, offset = {k: [] for k in cls.ARRAYS[:-1]}, [], 0
+        for t in trees:
+            tr, n = t.tree_, t.tree_.node_count
+            leaf  = tr.children_left == -1
+            parts["left"].append(np.where(leaf, -1, tr.children_left + offset))
+            parts["right"].append(np.where(leaf, -1, tr.children_right + offset))
+            parts["feature"].append(np.where(leaf, 0, tr.feature))
+            parts["threshold"].append(tr.threshold)
+            parts["value"].append(tr.value[:, 0, 0])
+            roots.append(offset)
+            offset += n
+        arrays = {
+            "left":      np.concatenate(parts["left"]).astype(np.int32),
+            "right":     np.concatenate(parts["right"]).astype(np.int32),
+            "feature":   np.concatenate(parts["feature"]).astype(np.int32),
+            "threshold": np.concatenate(parts["threshold"]).astype(np.float64),
+            "value":     np.concatenate(parts["value"]).astype(np.float64),
+            "roots":     np.array(roots, dtype=np.int32),
+        }
+        names = getattr(model, "feature_names_in_", None)
+        meta  = {"kind": kind, "scale": scale, "base": base, "n_features": int(model.n_features_in_),
+                 "features": [str(c) for c in names] if names is not None else None}
+        return cls(arrays, meta)
+
+    def predict(self, X):
+        if self.source and len(X) > MODEL_FLAT_MAX_ROWS:
+            return self.estimator().predict(X)
+        # sklearn trees evaluate float32 inputs against float64 thresholds; mirror that exactly.
+        X    = np.asarray(X, dtype=np.float32)
+        idx  = np.tile(self.roots, (len(X), 1))
+        rows = np.broadcast_to(np.arange(len(X))[:, None], idx.shape)
+        active = self.left[idx] != -1
+        while active.any():
+            node = idx[active]
+            go_left = X[rows[active], self.feature[node]] <= self.threshold[node]
+            idx[active] = np.where(go_left, self.left[node], self.right[node])
+            active = self.left[idx] != -1
+        return self.meta["base"] + self.meta["scale"] * self.value[idx].sum(axis=1)
+
+    def save(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        for k in self.ARRAYS:
+            np.save(os.path.join(folder, f"{k}.npy"), np.ascontiguousarray(getattr(self, k)))
+        with open(os.path.join(folder, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, folder, mmap=True, source=None):
+        with open(os.path.join(folder, "meta.json")) as f:
+            meta = json.load(f)
+        return cls({k: np.load(os.path.join(folder, f"{k}.npy"), mmap_mode="r" if mmap else None)
+                    for k in cls.ARRAYS}, meta, source)
+
+
+def _fresh(artifact, source):
+    return os.path.exists(artifact) and os.path.getmtime(artifact) >= os.path.getmtime(source)
+
+
+@contextmanager
+def _export_lock(stem):
+    """Serialize artifact exports across worker processes (advisory flock; where fcntl
+    is unavailable callers rely on the post-rename freshness check instead)."""
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    with open(f"{stem}.export.lock", "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _install(tmp, dest, source):
+    """Atomically move a finished tmp artifact to dest; a fresh dest left by a
+    concurrent exporter counts as success."""
+    try:
+        if os.path.isdir(dest) and not _fresh(dest, source):
+            shutil.rmtree(dest, ignore_errors=True)
+        os.replace(tmp, dest)
+    except OSError:
+        if not _fresh(dest, source):
+            raise
+
+
+def _discard(tmp):
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp, ignore_errors=True)
+    elif os.path.exists(tmp):
+        os.remove(tmp)
+
+
+def export_model_artifact(path, cols=None):
+    """Write the mmap-able artifact next to a pickled model; returns its path.
+    Flattened trees are only kept if they reproduce the original predictions."""
+    stem, model = os.path.splitext(path)[0], joblib.load(path)
+    flat = FlatTreeModel.from_sklearn(model)
+    if flat is not None:
+        X = np.random.default_rng(0).uniform(0, 10_000, (256, flat.meta["n_features"]))
+        names = list(cols if cols is not None else flat.feature_names_in_ if flat.feature_names_in_ is not None else [])
+        flags = [i for i, c in enumerate(names) if c not in NUMERIC_FEATURES]   # one-hot columns are 0-1
+        X[:, flags] = X[:, flags] > 5_000
+        probe = pd.DataFrame(X, columns=flat.feature_names_in_) if flat.feature_names_in_ is not None else X
+        if np.allclose(flat.predict(X), model.predict(probe), rtol=1e-9, atol=1e-6):
+            dest, tmp = f"{stem}.flat", f"{stem}.flat.{os.getpid()}.tmp"
+            try:
+                flat.save(tmp)
+                _install(tmp, dest, path)
+            finally:
+                _discard(tmp)
+            return dest
+        log.warning("flattened %s disagrees with the original; using joblib mmap", type(model).__name__)
+    dest, tmp = f"{stem}.mmap.joblib", f"{stem}.mmap.joblib.{os.getpid()}.tmp"
+    try:
+        joblib.dump(model, tmp, compress=0)            # mmap needs uncompressed arrays
+        _install(tmp, dest, path)
+    finally:
+        _discard(tmp)
+    return dest
+
+
+def load_model_artifact(path, mmap=MODEL_MMAP, cols=None):
+    if not mmap:
+        return joblib.load(path)
+    stem = os.path.splitext(path)[0]
+    try:
+        with _export_lock(stem):   # the first worker exports, the rest find it fresh
+            if not (_fresh(f"{stem}.flat", path) or _fresh(f"{stem}.mmap.joblib", path)):
+                export_model_artifact(path, cols)
+    except OSError as e:
+        log.warning("model artifact export failed (%s); loading %s directly", e, path)
+        return joblib.load(path)
+    if _fresh(f"{stem}.flat", path):
+        return FlatTreeModel.load(f"{stem}.flat", source=path)
+    return joblib.load(f"{stem}.mmap.joblib", mmap_mode="r")
+
+
+# ── MODEL REGISTRY ───────────────────────────────────────────────
+# models/<version>/{model.pkl, columns.pkl, meta.json}; meta.json records the version,
+# creation time and sha256 of each file. models/CURRENT (optional) pins a version,
+# otherwise the highest version name wins. Without a registry the legacy
+# house_model.pkl / model_columns.pkl pair is served.
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "models")
+MODEL_POLL_SECS    = float(os.getenv("MODEL_POLL_SECS", "30"))
+ModelHandle        = namedtuple("ModelHandle", "model cols version")
+
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _version_key(name):
+    """Natural order for version folder names: digit runs compare as numbers, so v10 > v9
+    and 1.10 > 1.9; the name itself breaks ties such as v010 / v10."""
+    return [(0, int(t), "") if t.isdigit() else (1, 0, t) for t in re.findall(r"\d+|\D+", name)], name
+
+
+class ModelRegistry:
+    """Serves the newest verified model version. A daemon thread polls the registry,
+    loads and warms new versions off the request path, then swaps them in by
+    replacing a single reference — runs already holding the old handle finish on it."""
+
+    def __init__(self, root=MODEL_REGISTRY_DIR, poll_secs=MODEL_POLL_SECS):
+        self.root       = root
+        self.poll_secs  = poll_secs
+        self.last_error = None
+        self.loaded_at  = None
+        self._lock      = threading.Lock()
+        self._handle    = ModelHandle(None, None, None)
+        self.check()
+        threading.Thread(target=self._watch, name="model-registry", daemon=True).start()
+
+    def current(self):
+        return self._handle
+
+    def latest_version(self):
+        pinned = os.path.join(self.root, "CURRENT")
+        if os.path.exists(pinned):
+            with open(pinned) as f:
+                return f.read().strip() or None
+        if not os.path.isdir(self.root):
+            return None
+        versions = [v for v in os.listdir(self.root)
+                    if os.path.exists(os.path.join(self.root, v, "meta.json"))]
+        return max(versions, key=_version_key) if versions else None
+
+    def _load_version(self, version):
+        folder = os.path.join(self.root, version)
+        with open(os.path.join(folder, "meta.json")) as f:
+            meta = json.load(f)
+        for name, digest in meta.get("sha256", {}).items():
+            if _sha256_file(os.path.join(folder, name)) != digest:
+                raise ValueError(f"checksum mismatch for {version}/{name}")
+        cols = joblib.load(os.path.join(folder, "columns.pkl"))
+        return ModelHandle(load_model_artifact(os.path.join(folder, "model.pkl"), cols=cols), cols, version)
+
+    @staticmethod
+    def legacy_version():
+        try:
+            stat = os.stat("house_model.pkl")
+        except FileNotFoundError:
+            return None
+        return f"legacy-{stat.st_size:x}-{int(stat.st_mtime):x}"
+
+    def check(self):
+        """Load, warm and swap in the latest version if it differs from the served one."""
+        with self._lock:
+            try:
+                version = self.latest_version() or self.legacy_version()
+                if version is None or version == self._handle.version:
+                    return False
+                if version.startswith("legacy-"):
+                    cols   = joblib.load("model_columns.pkl")
+                    handle = ModelHandle(load_model_artifact("house_model.pkl", cols=cols), cols, version)
+                else:
+                    handle = self._load_version(version)
+                warm = pd.DataFrame(np.zeros((1, len(handle.cols))), columns=handle.cols)
+                handle.model.predict(warm)              # first predict pages in / JITs before users see it
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                log.warning("model registry: %s", self.last_error)
+                return False
+            self._handle, self.loaded_at, self.last_error = handle, datetime.now(), None
+            log.info("model registry: serving %s", handle.version)
+            return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_secs)
+            self.check()
+
+
 @st.cache_resource(show_spinner="Loading AI model…")
-def load_model():
+def get_model_registry():
+    return ModelRegistry()
+
+
+
+# ── PASSWORD HASHING ─────────────────────────────────────────────
+# Salted scrypt, stored as "scrypt$n$r$p$salt$hash" (base64). Raising PW_SCRYPT_N upgrades
+# existing hashes on their next login; so does any legacy unsalted SHA-256 hex digest.
+PW_SCRYPT_N     = int(os.getenv("PW_SCRYPT_N", str(2 ** 15)))   # 32 MiB per hash with r=8
+PW_SCRYPT_R     = 8
+PW_SCRYPT_P     = 1
+PW_WORKERS      = int(os.getenv("PW_WORKERS", str(min(4, os.cpu_count() or 1))))
+PW_MAX_PENDING  = int(os.getenv("PW_MAX_PENDING", "64"))   # hashes queued beyond this are refused
+
+
+class PasswordBusy(RuntimeError):
+    pass
+
+
+def _b64(b):   return base64.b64encode(b).decode()
+
+
+def _scrypt(pw, salt, n, r, p):
+    return hashlib.scrypt(pw.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+
+
+def _hash_sync(pw, n=PW_SCRYPT_N, r=PW_SCRYPT_R, p=PW_SCRYPT_P):
+    salt = os.urandom(16)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(_scrypt(pw, salt, n, r, p))}"
+
+
+def _verify_sync(pw, stored):
+    """(ok, needs_rehash) in constant time w.r.t. the stored digest. A malformed or
+    truncated stored hash never verifies."""
     try:
-        return joblib.load("house_model.pkl"), joblib.load("model_columns.pkl")
-    except FileNotFoundError:
-        return None, None
+        if stored.startswith("scrypt$"):
+            _, n, r, p, salt, digest = stored.split("$")
+            n, r, p = int(n), int(r), int(p)
+            ok = hmac.compare_digest(_scrypt(pw, base64.b64decode(salt, validate=True), n, r, p),
+                                     base64.b64decode(digest, validate=True))
+            return ok, ok and (n, r, p) != (PW_SCRYPT_N, PW_SCRYPT_R, PW_SCRYPT_P)
+        ok = hmac.compare_digest(hashlib.sha256(pw.encode()).hexdigest(), stored)   # legacy
+    except (ValueError, TypeError, AttributeError):   # bad fields, base64 or scrypt parameters
+        return False, False
+    return ok, ok
+
+
+class PasswordHasher:
+    """Runs the KDF on its own bounded thread pool. hashlib.scrypt releases the GIL, so
+    a login costs the script thread a wait, not the interpreter; at most `workers` hashes
+    run at once and more than `max_pending` in flight are refused rather than queued."""
+
+    def __init__(self, workers=PW_WORKERS, max_pending=PW_MAX_PENDING):
+        self.workers  = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="proproperty-kdf")
+        self._slots   = threading.BoundedSemaphore(max_pending)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordBusy("Too many sign-ins in progress — please try again in a moment.")
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, pw):
+        return self._run(_hash_sync, pw)
+
+    def verify(self, pw, stored):
+        return self._run(_verify_sync, pw, stored)
+
+
+@st.cache_resource
+def get_password_hasher():
+    return PasswordHasher()
+
+
+password_hasher = get_password_hasher()
+
+
+def benchmark_login(n=64, concurrency=8):
+    """Concurrent verifications at the configured cost: logins/s and latency percentiles."""
+    stored = _hash_sync("benchmark-password")
+
+    def one(_):
+        t0 = time.perf_counter()
+        password_hasher.verify("benchmark-password", stored)
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as sessions:
+        lat = np.array(list(sessions.map(one, range(n)))) * 1000
+    wall = time.perf_counter() - t0
+    return {"logins_per_s": n / wall, "p50_ms": float(np.percentile(lat, 50)),
+            "p95_ms": float(np.percentile(lat, 95)), "workers": password_hasher.workers,
+            "cost": f"N=2^{PW_SCRYPT_N.bit_length() - 1}, r={PW_SCRYPT_R}, p={PW_SCRYPT_P}"}
+
+
+# ── LOGIN RATE LIMITING ──────────────────────────────────────────
+# Token buckets per username and per client, plus exponential lockout after consecutive
+# failures. Lockout is keyed on client and username+client, never username alone, and a
+# client that has signed in as a user before skips that user's bucket, so a stuffing
+# script can't lock a real user out from their own device.
+#   kind: (bucket size, refill tokens/s, lock after N consecutive failures)
+LOGIN_RULES = {
+    "user":   (5,    5 / 60,  None),
+    "client": (20,   20 / 60, 20),
+    "pair":   (None, 0.0,     5),
+}
+LOCKOUT_BASE       = 30        # seconds for the first lockout, doubling per further failure
+LOCKOUT_MAX        = 3600
+LOGIN_LIMIT_KEYS   = 100_000   # entries kept in memory; least recently touched go first
+LOGIN_LIMIT_SHARED = os.getenv("LOGIN_LIMIT_SHARED", "0") == "1"   # persist state for multi-process
+# Comma-separated proxy addresses/CIDRs whose X-Forwarded-For is believed; empty = none.
+TRUSTED_PROXIES    = [ipaddress.ip_network(n.strip(), strict=False)
+                      for n in os.getenv("TRUSTED_PROXIES", "").split(",") if n.strip()]
+
+
+class LoginLimiter:
+    """In-memory limiter state: key -> [tokens, updated, failures, locked_until]; pair
+    entries have no bucket, their tokens slot is 1 once that client has signed in as
+    that user. Idle entries are evicted once a minute. With shared=True the login_limits
+    table is read before and written after each decision, so every process sees the
+    same state; attempts the local state already refuses skip the database. Rows are
+    merged, never blindly overwritten: the newer bucket wins, failures and lockouts
+    keep the larger value (a success still resets failures)."""
+
+    def __init__(self, shared=LOGIN_LIMIT_SHARED, maxsize=LOGIN_LIMIT_KEYS):
+        self.shared   = shared
+        self.maxsize  = maxsize
+        self._state   = OrderedDict()
+        self._lock    = threading.Lock()
+        self._evicted = time.time()
+        self.rejected = 0
+
+    @staticmethod
+    def keys(username, client):
+        u = username.strip().lower()
+        return {"user": f"user:{u}", "client": f"client:{client}", "pair": f"pair:{client}:{u}"}
+
+    def _entry(self, kind, key, now):
+        e = self._state.get(key)
+        if e is None:
+            e = self._state[key] = [float(LOGIN_RULES[kind][0] or 0), now, 0, 0.0]
+        self._state.move_to_end(key)
+        burst, rate, _ = LOGIN_RULES[kind]
+        if burst:
+            e[0] = min(burst, e[0] + (now - e[1]) * rate)
+        e[1] = now
+        return e
+
+    def _entries(self, keys, now):
+        entries = {kind: self._entry(kind, key, now) for kind, key in keys.items()}
+        if entries["pair"][0] >= 1:   # known-good client: the per-user bucket doesn't apply
+            del entries["user"]
+        return entries
+
+    def _peek(self, keys):
+        """The entries that exist, untouched: a read must not make stale state look newer."""
+        entries = {kind: e for kind, key in keys.items() if (e := self._state.get(key)) is not None}
+        if entries.get("pair", [0])[0] >= 1:
+            entries.pop("user", None)
+        return entries
+
+    @staticmethod
+    def _wait(entries, now):
+        wait = 0.0
+        for kind, e in entries.items():
+            burst, rate, _ = LOGIN_RULES[kind]
+            wait = max(wait, e[3] - now)
+            if burst:
+                tokens = min(burst, e[0] + (now - e[1]) * rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+        return wait
+
+    def check(self, username, client):
+        """(allowed, retry_after_seconds). Consumes one token per bucket when allowed."""
+        keys = self.keys(username, client)
+        if self.shared:
+            with self._lock:
+                wait = self._wait(self._peek(keys), time.time())
+            if wait > 0:
+                self.rejected += 1
+                return False, wait
+            self._load(keys.values())
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entries = self._entries(keys, now)
+            wait    = self._wait(entries, now)
+            if wait > 0:
+                self.rejected += 1
+            else:
+                for kind, e in entries.items():
+                    if LOGIN_RULES[kind][0]:
+                        e[0] -= 1
+        if self.shared:
+            self._save(keys.values(), buckets_only=True)
+        return wait <= 0, wait
+
+    def record(self, username, client, success):
+        keys = self.keys(username, client)
+        if self.shared:
+            self._load(keys.values())
+        now  = time.time()
+        with self._lock:
+            for kind, key in keys.items():
+                lock_after = LOGIN_RULES[kind][2]
+                if lock_after is None:
+                    continue
+                e = self._entry(kind, key, now)
+                if success:
+                    e[2] = 0
+                    if kind == "pair":
+                        e[0] = 1.0
+                else:
+                    e[2] += 1
+                    if e[2] >= lock_after:
+                        e[3] = now + min(LOCKOUT_BASE * 2 ** (e[2] - lock_after), LOCKOUT_MAX)
+        if self.shared:
+            self._save(keys.values())
+
+    def _evict(self, now):
+        if now - self._evicted < 60:
+            return
+        self._evicted = now
+        idle = [k for k, e in self._state.items() if now - e[1] > LOCKOUT_MAX and e[3] < now]
+        for k in idle:
+            del self._state[k]
+        while len(self._state) > self.maxsize:
+            self._state.popitem(last=False)
+        if self.shared:
+            with engine.begin() as con:
+                con.execute(text("DELETE FROM login_limits WHERE updated < :t AND locked_until < :now"),
+                            {"t": now - LOCKOUT_MAX, "now": now})
+
+    def _load(self, keys):
+        params = {f"k{i}": k for i, k in enumerate(keys)}
+        with engine.connect() as con:
+            rows = con.execute(text(f"SELECT key, tokens, updated, failures, locked_until FROM login_limits "
+                                    f"WHERE key IN ({', '.join(':' + p for p in params)})"), params).fetchall()
+        with self._lock:
+            for key, tokens, updated, failures, locked_until in rows:
+                mine = self._state.get(key)
+                if mine is None:
+                    self._state[key] = [tokens, updated, failures, locked_until]
+                    continue
+                if updated >= mine[1]:
+                    mine[0], mine[1] = tokens, updated
+                mine[2] = max(mine[2], failures)
+                mine[3] = max(mine[3], locked_until)
+
+    def _save(self, keys, buckets_only=False):
+        """Upsert the entries. buckets_only (a check) leaves failures and lockouts to record();
+        otherwise failures keep the larger value unless this write resets them, and
+        locked_until only ever grows."""
+        with self._lock:
+            rows = [{"k": k, "t": e[0], "u": e[1], "f": e[2], "l": e[3]}
+                    for k in keys if (e := self._state.get(k)) is not None]
+        update = "tokens = excluded.tokens, updated = excluded.updated"
+        if not buckets_only:
+            update += """,
+                    failures = CASE WHEN excluded.failures = 0 OR excluded.failures > login_limits.failures
+                                    THEN excluded.failures ELSE login_limits.failures END,
+                    locked_until = CASE WHEN excluded.locked_until > login_limits.locked_until
+                                        THEN excluded.locked_until ELSE login_limits.locked_until END"""
+        with engine.begin() as con:
+            con.execute(text(f"""
+                INSERT INTO login_limits (key, tokens, updated, failures, locked_until)
+                VALUES (:k, :t, :u, :f, :l)
+                ON CONFLICT(key) DO UPDATE SET {update}"""), rows)
+
+    def stats(self):
+        return {"keys": len(self._state), "rejected": self.rejected,
+                "locked": sum(e[3] > time.time() for e in list(self._state.values()))}
+
+
+@st.cache_resource
+def get_login_limiter():
+    return LoginLimiter()
+
+
+login_limiter = get_login_limiter()
+
+
+def _trusted_proxy(addr):
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in net for net in TRUSTED_PROXIES)
+
+
+def client_id():
+    """Client address for rate limiting: the socket peer, or — only when that peer is one
+    of TRUSTED_PROXIES — the nearest X-Forwarded-For hop that isn't a trusted proxy."""
+    ip   = st.context.ip_address
+    addr = ip if isinstance(ip, str) else None
+    if addr and _trusted_proxy(addr):
+        for hop in reversed((st.context.headers.get("X-Forwarded-For") or "").split(",")):
+            addr = hop.strip() or addr
+            if not _trusted_proxy(addr):
+                break
+    return addr or "unknown"
 
-model, MODEL_COLS = load_model()
 
 # ── AUTH ─────────────────────────────────────────────────────────
-def hash_pw(pw):   return hashlib.sha256(pw.encode()).hexdigest()
-def verify_pw(pw, h): return hash_pw(pw) == h
+def hash_pw(pw):   return password_hasher.hash(pw)
+
+USER_CACHE_SIZE = 10_000
+USER_TTL        = 300   # "taken" — usernames are never released, this only bounds staleness of memory
+USER_NEG_TTL    = 5     # "available" goes stale the moment someone else registers it
+SESSION_TTL     = int(os.getenv("SESSION_TTL", str(12 * 3600)))   # idle timeout: each resume rotates the token
+SESSION_PARAM   = "sid"  # query parameter carrying the session token across page reloads
+
+
+@st.cache_resource
+def get_user_cache():
+    return LRUCache(USER_CACHE_SIZE)
+
 
 def user_exists(u):
+    """TTL-cached, so the register form can check the name on every rerun while typing."""
+    cache = get_user_cache()
+    found = cache.get(u)
+    if found is not _MISS:
+        return found
     with engine.connect() as con:
-        return con.execute(text("SELECT 1 FROM users WHERE username=:u"),{"u":u}).fetchone() is not None
-
-def register_user(u, pw):
+        found = con.execute(text("SELECT 1 FROM users WHERE username=:u"),{"u":u}).fetchone() is not None
+    cache.put(u, found, ttl=USER_TTL if found else USER_NEG_TTL)
+    return found
+
+def register_user(u, pw, client="unknown"):
+    """One INSERT; the primary key decides races between two sign-ups for the same name.
+    Rate-limited and checked against the username cache before the KDF runs, so sign-up
+    can't be used to burn hashing CPU."""
+    allowed, wait = login_limiter.check(f"register:{u}", client)
+    if not allowed:      return False, f"Too many attempts — try again in {wait:,.0f}s."
     if not u.strip():    return False, "Username cannot be empty."
-    if user_exists(u):   return False, "Username already taken."
     if len(pw) < 6:      return False, "Password must be at least 6 characters."
-    with engine.connect() as con:
-        con.execute(text("INSERT INTO users VALUES(:u,:p,:t)"),
-                    {"u":u,"p":hash_pw(pw),"t":datetime.now().isoformat()})
-        con.commit()
+    if user_exists(u):   return False, "Username already taken."
+    try:
+        hashed = hash_pw(pw)
+    except PasswordBusy as e:
+        return False, str(e)
+    try:
+        with engine.begin() as con:
+            con.execute(text("INSERT INTO users VALUES(:u,:p,:t)"),
+                        {"u":u,"p":hashed,"t":datetime.now().isoformat()})
+    except IntegrityError:
+        get_user_cache().put(u, True, ttl=USER_TTL)
+        return False, "Username already taken."
+    get_user_cache().put(u, True, ttl=USER_TTL)
     return True, "ok"
 
-def login_user(u, pw):
+def login_user(u, pw, client="unknown"):
+    allowed, wait = login_limiter.check(u, client)   # before any DB read or hashing
+    if not allowed:              return False, f"Too many attempts — try again in {wait:,.0f}s."
     with engine.connect() as con:
         row = con.execute(text("SELECT password FROM users WHERE username=:u"),{"u":u}).fetchone()
-    if not row:                  return False, "Username not found."
-    if not verify_pw(pw, row[0]):return False, "Incorrect password."
+    if not row:
+        login_limiter.record(u, client, False)
+        return False, "Username not found."
+    try:
+        ok, rehash = password_hasher.verify(pw, row[0])
+    except PasswordBusy as e:    return False, str(e)
+    login_limiter.record(u, client, ok)
+    if not ok:                   return False, "Incorrect password."
+    if rehash:                   # legacy SHA-256 or an older cost: upgrade while we have the password
+        try:
+            upgraded = hash_pw(pw)
+            with engine.begin() as con:
+                con.execute(text("UPDATE users SET password=:p WHERE username=:u AND password=:old"),
+                            {"p": upgraded, "u": u, "old": row[0]})
+        except (PasswordBusy, SQLAlchemyError) as e:   # sign in anyway, upgrade on a later login
+            log.warning("password rehash for %s deferred: %s", u, e)
     return True, "ok"
 
+# Session tokens: the browser holds the token (in the URL), the table holds its SHA-256,
+# so a leaked table can't be replayed. A reload resumes without re-entering credentials
+# and swaps the token for a fresh one, so a copy of an older URL (history, Referer, a
+# shared link) is already dead. Streamlit can read cookies but not set them, hence the URL.
+def _token_key(token): return hashlib.sha256(token.encode()).hexdigest()
+
+def create_session(u):
+    token, now = secrets.token_urlsafe(32), time.time()
+    with engine.begin() as con:
+        con.execute(text("DELETE FROM sessions WHERE expires < :now"), {"now": now})
+        con.execute(text("INSERT INTO sessions VALUES(:t,:u,:e)"),
+                    {"t": _token_key(token), "u": u, "e": now + SESSION_TTL})
+    return token
+
+def session_user(token):
+    with engine.connect() as con:
+        row = con.execute(text("SELECT username FROM sessions WHERE token=:t AND expires > :now"),
+                          {"t": _token_key(token), "now": time.time()}).fetchone()
+    return row[0] if row else None
+
+def end_session(token):
+    with engine.begin() as con:
+        con.execute(text("DELETE FROM sessions WHERE token=:t"), {"t": _token_key(token)})
+
+def rotate_session(token):
+    """(username, new token) for a live token, which is revoked; (None, None) otherwise."""
+    u = session_user(token)
+    if u is None:
+        return None, None
+    end_session(token)
+    return u, create_session(u)
+
 # ── LOCATION DATA ────────────────────────────────────────────────
 COUNTRY_STATES = {
     "India": ["Andhra Pradesh","Arunachal Pradesh","Assam","Bihar","Chhattisgarh",
@@ -477,112 +1324,499 @@ COUNTRY_STATES = {
 }
 COUNTRY_CODES = {"India":"IN","USA":"US","UK":"GB","Canada":"CA","UAE":"AE","Australia":"AU"}
 
-PINCODE_DB = {
-    "400001":("Mumbai","Maharashtra",18.9388,72.8354), "400051":("Mumbai","Maharashtra",19.0596,72.8295),
-    "400070":("Mumbai","Maharashtra",19.0728,72.8826), "411001":("Pune","Maharashtra",18.5196,73.8553),
-    "411014":("Pune","Maharashtra",18.5642,73.9140),   "411057":("Pune","Maharashtra",18.6298,73.7997),
-    "440001":("Nagpur","Maharashtra",21.1458,79.0882),  "431001":("Aurangabad","Maharashtra",19.8762,75.3433),
-    "422001":("Nashik","Maharashtra",19.9975,73.7898),
-    "560001":("Bangalore","Karnataka",12.9716,77.5946), "560034":("Bangalore","Karnataka",12.9352,77.6245),
-    "560068":("Bangalore","Karnataka",12.9010,77.6490), "575001":("Mangalore","Karnataka",12.8698,74.8430),
-    "580001":("Hubli","Karnataka",15.3647,75.1240),
-    "600001":("Chennai","Tamil Nadu",13.0827,80.2707),  "600042":("Chennai","Tamil Nadu",13.0500,80.2120),
-    "641001":("Coimbatore","Tamil Nadu",11.0168,76.9558),"625001":("Madurai","Tamil Nadu",9.9252,78.1198),
-    "620001":("Tiruchirappalli","Tamil Nadu",10.7905,78.7047),
-    "110001":("New Delhi","Delhi",28.6139,77.2090),     "110011":("New Delhi","Delhi",28.5921,77.1645),
-    "110034":("Delhi","Delhi",28.7130,77.1475),         "110058":("Delhi","Delhi",28.6508,77.0627),
-    "110092":("Delhi","Delhi",28.6692,77.3090),
-    "500001":("Hyderabad","Telangana",17.3850,78.4867), "500032":("Hyderabad","Telangana",17.4435,78.3772),
-    "500081":("Hyderabad","Telangana",17.4947,78.3996), "506001":("Warangal","Telangana",17.9784,79.5941),
-    "380001":("Ahmedabad","Gujarat",23.0225,72.5714),   "380015":("Ahmedabad","Gujarat",23.0395,72.5070),
-    "395001":("Surat","Gujarat",21.1702,72.8311),       "390001":("Vadodara","Gujarat",22.3072,73.1812),
-    "360001":("Rajkot","Gujarat",22.3039,70.8022),
-    "302001":("Jaipur","Rajasthan",26.9124,75.7873),    "302021":("Jaipur","Rajasthan",26.8467,75.8070),
-    "313001":("Udaipur","Rajasthan",24.5854,73.7125),   "342001":("Jodhpur","Rajasthan",26.2389,73.0243),
-    "226001":("Lucknow","Uttar Pradesh",26.8467,80.9462),"226010":("Lucknow","Uttar Pradesh",26.8728,80.9942),
-    "201001":("Ghaziabad","Uttar Pradesh",28.6692,77.4538),"211001":("Prayagraj","Uttar Pradesh",25.4358,81.8463),
-    "282001":("Agra","Uttar Pradesh",27.1767,78.0081),  "221001":("Varanasi","Uttar Pradesh",25.3176,82.9739),
-    "700001":("Kolkata","West Bengal",22.5726,88.3639),  "700054":("Kolkata","West Bengal",22.5200,88.3700),
-    "700102":("Kolkata","West Bengal",22.6200,88.4300),
-    "160001":("Chandigarh","Chandigarh",30.7333,76.7794),"141001":("Ludhiana","Punjab",30.9010,75.8573),
-    "143001":("Amritsar","Punjab",31.6340,74.8723),
-    "682001":("Kochi","Kerala",9.9312,76.2673),          "695001":("Thiruvananthapuram","Kerala",8.5241,76.9366),
-    "673001":("Kozhikode","Kerala",11.2588,75.7804),
-    "462001":("Bhopal","Madhya Pradesh",23.2599,77.4126),"452001":("Indore","Madhya Pradesh",22.7196,75.8577),
-    "474001":("Gwalior","Madhya Pradesh",26.2183,78.1828),
-    "122001":("Gurgaon","Haryana",28.4595,77.0266),     "121001":("Faridabad","Haryana",28.4089,77.3178),
-    "132001":("Karnal","Haryana",29.6857,76.9905),
-    "520001":("Vijayawada","Andhra Pradesh",16.5062,80.6480),"530001":("Visakhapatnam","Andhra Pradesh",17.6868,83.2185),
-    "751001":("Bhubaneswar","Odisha",20.2961,85.8245),   "753001":("Cuttack","Odisha",20.4625,85.8830),
-    "800001":("Patna","Bihar",25.5941,85.1376),          "781001":("Guwahati","Assam",26.1445,91.7362),
-    "834001":("Ranchi","Jharkhand",23.3441,85.3096),     "248001":("Dehradun","Uttarakhand",30.3165,78.0322),
-    "171001":("Shimla","Himachal Pradesh",31.1048,77.1734),"403001":("Panaji","Goa",15.4909,73.8278),
-}
+# ── GAZETTEER INDEX ──────────────────────────────────────────────
+# Pincodes and city coordinates live in data/*.csv and are indexed on first use.
+GAZETTEER_DIR = os.getenv("GAZETTEER_DIR", "data")
+TRIE_KEEP     = 8      # best completions kept per trie node
+FUZZY_MIN     = 0.5    # minimum trigram Dice score for a fuzzy match
+
+
+def _norm(s):
+    s = unicodedata.normalize("NFKD", str(s)).encode("ascii", "ignore").decode()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", s.lower()).split())
+
+
+def _trigrams(s):
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class Gazetteer:
+    """City/pincode lookup: normalized exact map, prefix trie and trigram index.
+    Ranking is deterministic: exact > contained place name (longest) > prefix
+    (shortest) > fuzzy (best score, then shortest); ties break alphabetically."""
+
+    def __init__(self, cities, pincodes):
+        self.pincodes = pincodes
+        self.coords   = {}
+        for name, coords in cities:
+            self.coords.setdefault(_norm(name), coords)
+        self.names    = sorted(self.coords, key=lambda n: (len(n), n))
+        self.trie     = {}
+        self.grams    = {}
+        for i, name in enumerate(self.names):
+            node = self.trie
+            for ch in name:
+                node = node.setdefault(ch, {})
+                best = node.setdefault("", [])
+                if len(best) < TRIE_KEEP:
+                    best.append(name)     # names are pre-sorted, so the first kept are the best
+            for g in _trigrams(name):
+                self.grams.setdefault(g, []).append(i)
+
+    @classmethod
+    def load(cls, folder=GAZETTEER_DIR):
+        with open(os.path.join(folder, "cities.csv"), newline="", encoding="utf-8") as f:
+            cities = [(r["name"], (float(r["lat"]), float(r["lon"]))) for r in csv.DictReader(f)]
+        with open(os.path.join(folder, "pincodes.csv"), newline="", encoding="utf-8") as f:
+            pins = {r["pincode"]: (r["city"], r["state"], float(r["lat"]), float(r["lon"]))
+                    for r in csv.DictReader(f)}
+        return cls(cities, pins)
+
+    def pincode(self, code):
+        return self.pincodes.get(code.strip())
+
+    def prefix(self, key):
+        node = self.trie
+        for ch in key:
+            node = node.get(ch)
+            if node is None:
+                return []
+        return node.get("", [])
+
+    def match(self, query):
+        """Best (name, coords) for a free-text city, or None."""
+        key = _norm(query)
+        if not key:
+            return None
+        if key in self.coords:
+            return key, self.coords[key]
+        tokens = key.split()
+        for size in range(len(tokens) - 1, 0, -1):           # "andheri west mumbai" -> "mumbai"
+            hits = sorted({" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+                          & self.coords.keys())
+            if hits:
+                return hits[0], self.coords[hits[0]]
+        completions = self.prefix(key)
+        if completions:
+            return completions[0], self.coords[completions[0]]
+        q_grams = _trigrams(key)
+        shared  = {}
+        for g in q_grams:
+            for i in self.grams.get(g, ()):
+                shared[i] = shared.get(i, 0) + 1
+        scored = [(2 * c / (len(q_grams) + len(_trigrams(self.names[i]))), i) for i, c in shared.items()]
+        scored = [(sc, i) for sc, i in scored if sc >= FUZZY_MIN]
+        if not scored:
+            return None
+        _, i = max(scored, key=lambda t: (t[0], -t[1]))      # index order = (len, name) order
+        return self.names[i], self.coords[self.names[i]]
+
+
+@functools.lru_cache(maxsize=None)
+def gazetteer():
+    return Gazetteer.load()
+
+
+# ── GEOCODING CACHE ──────────────────────────────────────────────
+ZIPPOPOTAM_URL = os.getenv("ZIPPOPOTAM_URL", "https://api.zippopotam.us")
+NOMINATIM_URL  = os.getenv("NOMINATIM_URL",  "https://nominatim.openstreetmap.org")
+GEO_TTL        = 30 * 86400   # found results
+GEO_NEG_TTL    = 86400        # "not found" results, so unknown pincodes aren't re-queried per user
+GEO_SWEEP_SECS = float(os.getenv("GEO_SWEEP_SECS", "900"))   # retry places still at 0/0 this often
+GEO_SWEEP_MAX  = 200          # places per sweep, newest first
+_MISS          = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with optional per-entry TTL and hit/miss/eviction counters."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize   = maxsize
+        self._data     = OrderedDict()   # key -> (expires or None, value)
+        self._lock     = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=_MISS):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (item[0] is not None and item[0] < time.time()):
+                self._data.pop(key, None)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.time() + ttl if ttl else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self):
+        return {"size": len(self._data), "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+
+class GeoCache:
+    """Geocoding results in the geocode_cache table (TTL, negative results stored as
+    null) fronted by an in-process LRU. Shared by every session and process."""
+
+    def __init__(self, maxsize=4096):
+        self.lru = LRUCache(maxsize)
+        with engine.begin() as con:
+            con.execute(text("DELETE FROM geocode_cache WHERE expires < :now"), {"now": time.time()})
+
+    def get_many(self, keys):
+        """key -> cached value (None = known miss) for every key that is cached."""
+        out, todo = {}, []
+        for k in dict.fromkeys(keys):
+            v = self.lru.get(k)
+            if v is _MISS:
+                todo.append(k)
+            else:
+                out[k] = v
+        for i in range(0, len(todo), 500):
+            params = {f"k{j}": k for j, k in enumerate(todo[i:i + 500])}
+            with engine.connect() as con:
+                rows = con.execute(text(
+                    f"SELECT key, value, expires FROM geocode_cache WHERE expires >= :now AND key IN "
+                    f"({','.join(':' + p for p in params)})"), {**params, "now": time.time()}).fetchall()
+            for key, value, expires in rows:
+                out[key] = json.loads(value) if value else None
+                self.lru.put(key, out[key], ttl=expires - time.time())
+        return out
+
+    def put_many(self, items):
+        """items: {key: value or None}; None is cached for GEO_NEG_TTL."""
+        if not items:
+            return
+        now, rows = time.time(), []
+        for key, value in items.items():
+            ttl = GEO_TTL if value is not None else GEO_NEG_TTL
+            self.lru.put(key, value, ttl=ttl)
+            rows.append({"k": key, "v": json.dumps(value) if value is not None else None, "e": now + ttl})
+        with engine.begin() as con:
+            con.execute(text("""
+                INSERT INTO geocode_cache (key, value, expires) VALUES (:k, :v, :e)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires
+            """), rows)
 
-CITY_COORDS = {
-    "mumbai":(18.9388,72.8354),"pune":(18.5196,73.8553),"bangalore":(12.9716,77.5946),
-    "bengaluru":(12.9716,77.5946),"chennai":(13.0827,80.2707),"hyderabad":(17.3850,78.4867),
-    "delhi":(28.6139,77.2090),"new delhi":(28.6139,77.2090),"kolkata":(22.5726,88.3639),
-    "ahmedabad":(23.0225,72.5714),"surat":(21.1702,72.8311),"jaipur":(26.9124,75.7873),
-    "lucknow":(26.8467,80.9462),"nagpur":(21.1458,79.0882),"patna":(25.5941,85.1376),
-    "indore":(22.7196,75.8577),"bhopal":(23.2599,77.4126),"visakhapatnam":(17.6868,83.2185),
-    "vadodara":(22.3072,73.1812),"ghaziabad":(28.6692,77.4538),"ludhiana":(30.9010,75.8573),
-    "agra":(27.1767,78.0081),"nashik":(19.9975,73.7898),"vijayawada":(16.5062,80.6480),
-    "rajkot":(22.3039,70.8022),"meerut":(28.9845,77.7064),"coimbatore":(11.0168,76.9558),
-    "chandigarh":(30.7333,76.7794),"amritsar":(31.6340,74.8723),"gurgaon":(28.4595,77.0266),
-    "gurugram":(28.4595,77.0266),"noida":(28.5355,77.3910),"kochi":(9.9312,76.2673),
-    "bhubaneswar":(20.2961,85.8245),"dehradun":(30.3165,78.0322),"ranchi":(23.3441,85.3096),
-    "guwahati":(26.1445,91.7362),"thiruvananthapuram":(8.5241,76.9366),
-    "mangalore":(12.8698,74.8430),"hubli":(15.3647,75.1240),"madurai":(9.9252,78.1198),
-    "varanasi":(25.3176,82.9739),"udaipur":(24.5854,73.7125),"jodhpur":(26.2389,73.0243),
-    "gwalior":(26.2183,78.1828),"faridabad":(28.4089,77.3178),"panaji":(15.4909,73.8278),
-    "shimla":(31.1048,77.1734),"aurangabad":(19.8762,75.3433),"warangal":(17.9784,79.5941),
-    "kozhikode":(11.2588,75.7804),"tiruchirappalli":(10.7905,78.7047),
-    "prayagraj":(25.4358,81.8463),"allahabad":(25.4358,81.8463),"cuttack":(20.4625,85.8830),
-    "karnal":(29.6857,76.9905),
-    "new york":(40.7128,-74.0060),"los angeles":(34.0522,-118.2437),"chicago":(41.8781,-87.6298),
-    "houston":(29.7604,-95.3698),"phoenix":(33.4484,-112.0740),"philadelphia":(39.9526,-75.1652),
-    "san antonio":(29.4241,-98.4936),"san diego":(32.7157,-117.1611),"dallas":(32.7767,-96.7970),
-    "san francisco":(37.7749,-122.4194),"seattle":(47.6062,-122.3321),"boston":(42.3601,-71.0589),
-    "miami":(25.7617,-80.1918),"atlanta":(33.7490,-84.3880),
-    "london":(51.5074,-0.1278),"manchester":(53.4808,-2.2426),"birmingham":(52.4862,-1.8904),
-    "glasgow":(55.8642,-4.2518),"edinburgh":(55.9533,-3.1883),
-    "dubai":(25.2048,55.2708),"abu dhabi":(24.4539,54.3773),"sharjah":(25.3463,55.4209),
-}
 
+@st.cache_resource
+def get_geo_cache():
+    return GeoCache()
 
-def lookup_pincode(pincode, cc="IN"):
-    if pincode in PINCODE_DB:
-        city, state, lat, lon = PINCODE_DB[pincode]
-        return {"city": city, "state": state, "lat": lat, "lon": lon}
+
+geo_cache = get_geo_cache()
+
+
+# ── HTTP CLIENT ──────────────────────────────────────────────────
+class CircuitOpenError(requests.RequestException):
+    """Raised without touching the network while a host's breaker is open."""
+
+
+def _retry_after(r):
+    """Seconds asked for by a Retry-After header (delta-seconds or HTTP-date), or None."""
+    value = r.headers.get("Retry-After") if r is not None else None
+    if not value:
+        return None
     try:
-        r = requests.get(f"https://api.zippopotam.us/{cc}/{pincode}", timeout=4)
-        if r.status_code == 200:
-            place = r.json()["places"][0]
-            return {"city": place.get("place name",""), "state": place.get("state",""),
-                    "lat": float(place.get("latitude",0)), "lon": float(place.get("longitude",0))}
-    except Exception:
+        return max(float(value), 0.0)
+    except ValueError:
         pass
-    return {}
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class _HostState:
+    def __init__(self, max_concurrency, min_interval):
+        self.sem          = threading.BoundedSemaphore(max_concurrency)
+        self.min_interval = min_interval
+        self.lock         = threading.Lock()
+        self.next_slot    = 0.0
+        self.failures     = 0          # consecutive
+        self.open_until   = 0.0
+        self.probing      = False
+        self.requests = self.errors = self.retries = self.short_circuits = 0
+        self.latency_sum = self.latency_max = 0.0
+
+    def wait_turn(self):
+        """Space calls at least min_interval apart (e.g. Nominatim's 1 req/s policy)."""
+        with self.lock:
+            now   = time.monotonic()
+            slot  = max(now, self.next_slot)
+            self.next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class HttpClient:
+    """Shared keep-alive requests.Session with per-host concurrency limits, rate
+    limiting, retry with exponential backoff and a consecutive-failure circuit breaker.
+    A Retry-After on 429/503 stretches the backoff, up to max_retry_after seconds; a longer
+    request gives up at once rather than hold the caller."""
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, pool_size=16, retries=2, backoff=0.5, fail_threshold=5, cooldown=30.0,
+                 max_retry_after=10.0):
+        self.session = requests.Session()
+        adapter      = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://",  adapter)
+        self.session.headers["User-Agent"] = "ProPropertyAI/1.0"
+        self.retries, self.backoff = retries, backoff
+        self.fail_threshold, self.cooldown = fail_threshold, cooldown
+        self.max_retry_after = max_retry_after
+        self._hosts = {}
+        self._lock  = threading.Lock()
+
+    def configure(self, url, max_concurrency=4, min_interval=0.0):
+        with self._lock:
+            self._hosts[urlsplit(url).netloc] = _HostState(max_concurrency, min_interval)
+
+    def _host(self, host):
+        with self._lock:
+            return self._hosts.setdefault(host, _HostState(4, 0.0))
+
+    def _admit(self, h):
+        with h.lock:
+            if h.open_until <= 0:
+                return
+            if time.monotonic() < h.open_until or h.probing:
+                h.short_circuits += 1
+                raise CircuitOpenError("circuit open")
+            h.probing = True                  # half-open: let exactly one probe through
+
+    def _record(self, h, ok):
+        with h.lock:
+            h.probing = False
+            if ok:
+                h.failures, h.open_until = 0, 0.0
+            else:
+                h.failures += 1
+                if h.failures >= self.fail_threshold or h.open_until > 0:
+                    h.open_until = time.monotonic() + self.cooldown
+
+    def get(self, url, timeout=5, **kwargs):
+        h = self._host(urlsplit(url).netloc)
+        self._admit(h)
+        error, wait = None, None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                if wait is not None and wait > self.max_retry_after:
+                    break
+                with h.lock:
+                    h.retries += 1
+                time.sleep(max(self.backoff * 2 ** (attempt - 1), wait or 0.0))
+            with h.sem:
+                h.wait_turn()
+                t0 = time.perf_counter()
+                try:
+                    r, error = self.session.get(url, timeout=timeout, **kwargs), None
+                except requests.RequestException as e:
+                    r, error = None, e
+                dt = time.perf_counter() - t0
+            failed = r is None or r.status_code in self.RETRY_STATUS
+            with h.lock:
+                h.requests    += 1
+                h.errors      += failed
+                h.latency_sum += dt
+                h.latency_max  = max(h.latency_max, dt)
+            if not failed:
+                self._record(h, True)
+                return r
+            error = error or requests.HTTPError(f"HTTP {r.status_code}", response=r)
+            wait  = _retry_after(r)
+        self._record(h, False)
+        raise error
+
+    def stats(self):
+        with self._lock:
+            hosts = dict(self._hosts)
+        now = time.monotonic()
+        return pd.DataFrame([{
+            "host": host, "requests": h.requests, "errors": h.errors, "retries": h.retries,
+            "short_circuits": h.short_circuits,
+            "state": "open" if h.open_until > now else ("half-open" if h.open_until else "closed"),
+            "avg_ms": 1000 * h.latency_sum / h.requests if h.requests else 0.0,
+            "max_ms": 1000 * h.latency_max,
+        } for host, h in hosts.items()])
+
+
+@st.cache_resource
+def get_http_client():
+    client = HttpClient()
+    client.configure(NOMINATIM_URL,  max_concurrency=1, min_interval=1.0)
+    client.configure(ZIPPOPOTAM_URL, max_concurrency=4)
+    return client
+
+
+http_client = get_http_client()
+
+
+def _fetch_all(fetch, items, workers=4):
+    """{key: fetch(*args)} for items {key: args}; keys whose fetch raised are left out."""
+    def run(kv):
+        key, args = kv
+        try:
+            return key, fetch(*args)
+        except Exception as e:
+            log.warning("%s%r failed: %s", fetch.__name__, args, e)
+            return key, _MISS
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        return {k: v for k, v in ex.map(run, items.items()) if v is not _MISS}
+
+
+def _pin_key(pincode, cc):
+    return f"pin:{cc}:{pincode.strip()}"
+
+
+def _geo_key(city, state, country):
+    return "geo:" + "|".join(str(x or "").strip().lower() for x in (city, state, country))
+
+
+def _fetch_pincode(pincode, cc):
+    """Upstream pincode lookup: dict, or None if the upstream has no such code.
+    Network errors raise so they are never cached as misses."""
+    r = http_client.get(f"{ZIPPOPOTAM_URL}/{cc}/{pincode}", timeout=4)
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    place = r.json()["places"][0]
+    return {"city": place.get("place name",""), "state": place.get("state",""),
+            "lat": float(place.get("latitude",0)), "lon": float(place.get("longitude",0))}
+
+
+def _fetch_geocode(city, state, country):
+    r = http_client.get(f"{NOMINATIM_URL}/search",
+                        params={"q": f"{city},{state},{country}", "format": "json", "limit": 1},
+                        timeout=5)
+    r.raise_for_status()
+    hits = r.json()
+    return [float(hits[0]["lat"]), float(hits[0]["lon"])] if hits else None
+
+
+def _local_pincode(pincode):
+    hit = gazetteer().pincode(pincode)
+    if hit:
+        city, state, lat, lon = hit
+        return {"city": city, "state": state, "lat": lat, "lon": lon}
+    return None
+
+
+def _local_city(city):
+    hit = gazetteer().match(city)
+    return hit[1] if hit else None
+
+
+def lookup_pincodes(pincodes, cc="IN", network=True):
+    """Batch pincode resolution: {pincode: result dict ({} if unknown)}, deduplicated,
+    local table -> cache -> one upstream call per distinct miss. With network=False,
+    pincodes that would need an upstream call are left out of the result."""
+    pins = [p.strip() for p in dict.fromkeys(pincodes) if p and p.strip()]
+    out  = {p: r for p in pins if (r := _local_pincode(p))}
+    keys = {_pin_key(p, cc): p for p in pins if p not in out}
+    for key, value in geo_cache.get_many(keys).items():
+        out[keys.pop(key)] = value or {}
+    if not network:
+        return {p: out[p] for p in pins if p in out}
+    fetched = _fetch_all(_fetch_pincode, {key: (p, cc) for key, p in keys.items()}) if keys else {}
+    for key, value in fetched.items():
+        out[keys[key]] = value or {}
+    geo_cache.put_many(fetched)
+    return {p: out.get(p, {}) for p in pins}
+
+
+def geocode_many(places, network=True):
+    """Batch geocoding of (city, state, country) triples -> {triple: (lat, lon)},
+    (0.0, 0.0) when unresolved. Same tiers, dedup and network flag as lookup_pincodes."""
+    places = [t for t in dict.fromkeys(places) if str(t[0] or "").strip()]
+    out    = {t: c for t in places if (c := _local_city(str(t[0])))}
+    keys   = {_geo_key(*t): t for t in places if t not in out}
+    for key, value in geo_cache.get_many(keys).items():
+        out[keys.pop(key)] = tuple(value) if value else (0.0, 0.0)
+    if not network:
+        return {t: out[t] for t in places if t in out}
+    fetched = _fetch_all(_fetch_geocode, keys) if keys else {}
+    for key, value in fetched.items():
+        out[keys[key]] = tuple(value) if value else (0.0, 0.0)
+    geo_cache.put_many(fetched)
+    return {t: out.get(t, (0.0, 0.0)) for t in places}
+
+
+def lookup_pincode(pincode, cc="IN"):
+    return lookup_pincodes([pincode], cc).get(pincode.strip(), {})
 
 
 def geocode_address(city, state, country):
-    key = city.strip().lower()
-    if key in CITY_COORDS:
-        return CITY_COORDS[key]
-    for name, coords in CITY_COORDS.items():
-        if key in name or name in key:
-            return coords
-    try:
-        r = requests.get("https://nominatim.openstreetmap.org/search",
-                         params={"q": f"{city},{state},{country}", "format": "json", "limit": 1},
-                         headers={"User-Agent": "ProPropertyAI/1.0"}, timeout=5)
-        if r.status_code == 200 and r.json():
-            d = r.json()[0]
-            return float(d["lat"]), float(d["lon"])
-    except Exception:
-        pass
-    return 0.0, 0.0
+    return geocode_many([(city, state, country)]).get((city, state, country), (0.0, 0.0))
+
+
+# ── BACKGROUND GEOCODING ─────────────────────────────────────────
+class Background:
+    """Worker pool shared by all sessions for slow side work (upstream geocoding),
+    plus a revision bumped whenever a worker changes coordinates the map shows."""
+
+    def __init__(self, workers=4):
+        self.executor     = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="proproperty-bg")
+        self.geo_revision = 0
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
+
+
+@st.cache_resource
+def get_background():
+    return Background()
+
+
+background = get_background()
+
+
+def backfill_locations(places):
+    """Geocode (city, state, country) triples upstream and write the coordinates into
+    every prediction of that place still missing them. Returns {triple: (lat, lon)}."""
+    coords = geocode_many(places)
+    rows   = [{"lat": la, "lon": lo, "c": c, "s": s_, "co": co}
+              for (c, s_, co), (la, lo) in coords.items() if la or lo]
+    if rows:
+        prediction_writer.flush()   # the valuation that triggered this may still be queued
+        with engine.begin() as con:
+            con.execute(text("""
+                UPDATE predictions SET lat = :lat, lon = :lon
+                WHERE city = :c AND state = :s AND country = :co
+                  AND (lat IS NULL OR lon IS NULL OR lat = 0 OR lon = 0)"""), rows)
+        background.geo_revision += 1
+    return coords
+
+
+def sweep_missing_locations(limit=GEO_SWEEP_MAX):
+    """Re-run backfill_locations for places whose predictions are still at 0/0: backfills
+    that failed (upstream down, circuit open) or rows that landed after theirs ran."""
+    with engine.connect() as con:
+        places = con.execute(text("""
+            SELECT city, state, country FROM predictions
+            WHERE (lat IS NULL OR lon IS NULL OR lat = 0 OR lon = 0) AND city != ''
+            GROUP BY city, state, country ORDER BY MAX(id) DESC LIMIT :n"""), {"n": limit}).all()
+    return backfill_locations([tuple(p) for p in places]) if places else {}
+
+
+@st.fragment(run_every=1.0)
+def _await_background(future):
+    """Invisible poller: rerun the page once a background future has finished."""
+    if future.done():
+        st.rerun()
 
 
 def build_input(inp):
@@ -614,44 +1848,872 @@ def price_segment(p):
     else:                return "Top-Range",       "🔴"
 
 
-def save_prediction(username, inp, price, segment, lat, lon, media_paths=""):
+# ── BATCH VALUATION ──────────────────────────────────────────────
+NUMERIC_FEATURES = ("area", "bedrooms", "bathrooms", "stories", "parking")
+AMENITY_FEATURES = ("mainroad", "guestroom", "basement", "hotwaterheating",
+                    "airconditioning", "prefarea")
+FURNISHING_COLS  = {"semi-furnished": "furnishingstatus_semi-furnished",
+                    "unfurnished":    "furnishingstatus_unfurnished"}
+SEGMENT_BOUNDS   = np.array([3_000_000, 8_000_000, 20_000_000])
+SEGMENT_LABELS   = np.array(["Low-Range", "Mid-Range", "High-Range", "Top-Range"])
+BATCH_CHUNK      = 50_000
+
+
+def _as_flag(s):
+    """Bool/0-1/'yes'-'no' column -> float 0/1 array."""
+    if s.dtype == object:
+        return s.astype(str).str.strip().str.lower().isin(("1", "yes", "y", "true")).to_numpy(np.float64)
+    return (pd.to_numeric(s, errors="coerce").fillna(0) != 0).to_numpy(np.float64)
+
+
+def build_input_batch(records, cols=None):
+    """Encode many property records into one preallocated matrix in MODEL_COLS order."""
+    cols = list(MODEL_COLS if cols is None else cols)
+    df   = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(records)
+    pos  = {c: i for i, c in enumerate(cols)}
+    X    = np.zeros((len(df), len(cols)), dtype=np.float64)
+    for f in NUMERIC_FEATURES:
+        if f in pos and f in df:
+            X[:, pos[f]] = pd.to_numeric(df[f], errors="coerce").fillna(0).to_numpy()
+    for f in AMENITY_FEATURES:
+        if f"{f}_yes" in pos and f in df:
+            X[:, pos[f"{f}_yes"]] = _as_flag(df[f])
+    if "furnishing" in df:
+        furn = df["furnishing"].astype(str).str.strip().str.lower().to_numpy()
+        for label, col in FURNISHING_COLS.items():
+            if col in pos:
+                X[:, pos[col]] = furn == label
+    return X
+
+
+def valuation_columns(prices, areas):
+    """Vectorized segment, ±10% range and ₹/sq ft for an array of predictions."""
+    prices = np.asarray(prices, dtype=np.float64)
+    areas  = np.asarray(areas,  dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ppsf = np.where(areas > 0, prices / areas, 0.0)
+    return pd.DataFrame({
+        "predicted_price": prices,
+        "segment":         SEGMENT_LABELS[np.searchsorted(SEGMENT_BOUNDS, prices, side="right")],
+        "low":             prices * 0.90,
+        "high":            prices * 1.10,
+        "price_per_sqft":  ppsf,
+    })
+
+
+def predict_batch(records, chunk_size=BATCH_CHUNK):
+    """Score a list/DataFrame of properties with one model.predict per chunk."""
+    df    = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(records)
+    X     = build_input_batch(df)
+    preds = np.empty(len(df), dtype=np.float64)
+    for start in range(0, len(df), chunk_size):
+        chunk = pd.DataFrame(X[start:start + chunk_size], columns=MODEL_COLS, copy=False)
+        preds[start:start + len(chunk)] = model.predict(chunk)
+    area = df["area"] if "area" in df else np.zeros(len(df))
+    return valuation_columns(preds, area)
+
+
+# ── PREDICTION CACHE ─────────────────────────────────────────────
+PREDICTION_CACHE_SIZE   = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_SHARED = os.getenv("PREDICTION_CACHE_SHARED", "0") == "1"
+
+
+class PredictionCache:
+    """Bounded LRU of model outputs keyed on hash(model version + canonical feature
+    vector). With shared=True a prediction_cache table lets processes share results."""
+
+    def __init__(self, maxsize=PREDICTION_CACHE_SIZE, shared=PREDICTION_CACHE_SHARED):
+        self.lru         = LRUCache(maxsize)
+        self.shared      = shared
+        self.shared_hits = 0
+        self._puts       = 0
+
+    @staticmethod
+    def key(x, version):
+        return hashlib.sha256(f"{version}|".encode() + np.ascontiguousarray(x, np.float64).tobytes()).hexdigest()
+
+    def get(self, key):
+        price = self.lru.get(key)
+        if price is not _MISS or not self.shared:
+            return None if price is _MISS else price
+        with engine.connect() as con:
+            row = con.execute(text("SELECT price FROM prediction_cache WHERE key=:k"), {"k": key}).fetchone()
+        if row is None:
+            return None
+        self.shared_hits += 1
+        self.lru.put(key, row[0])
+        return row[0]
+
+    def put(self, key, price):
+        self.lru.put(key, price)
+        if not self.shared:
+            return
+        with engine.begin() as con:
+            con.execute(text("""
+                INSERT INTO prediction_cache (key, price, created) VALUES (:k, :p, :t)
+                ON CONFLICT(key) DO NOTHING"""), {"k": key, "p": price, "t": time.time()})
+            self._puts += 1
+            if self._puts % 1000 == 0:     # keep the shared table bounded too
+                con.execute(text("""
+                    DELETE FROM prediction_cache WHERE created < (
+                        SELECT created FROM prediction_cache ORDER BY created DESC LIMIT 1 OFFSET :n)"""),
+                    {"n": self.lru.maxsize})
+
+    def clear(self):
+        self.lru = LRUCache(self.lru.maxsize)
+        if self.shared:
+            with engine.begin() as con:
+                con.execute(text("DELETE FROM prediction_cache"))
+
+    def stats(self):
+        s = self.lru.stats()
+        lookups = s["hits"] + s["misses"]
+        return {**s, "shared_hits": self.shared_hits, "hit_rate": s["hits"] / lookups if lookups else 0.0}
+
+
+@st.cache_resource
+def get_prediction_cache():
+    return PredictionCache()
+
+
+prediction_cache = get_prediction_cache()
+
+
+def predict_one(inp):
+    """Single valuation through the prediction cache. Returns (price, from_cache)."""
+    x   = build_input_batch([inp])
+    key = PredictionCache.key(x[0], MODEL_VERSION)
+    price = prediction_cache.get(key)
+    if price is not None:
+        return price, True
+    price = float(model.predict(pd.DataFrame(x, columns=MODEL_COLS, copy=False))[0])
+    prediction_cache.put(key, price)
+    return price, False
+
+
+def synthetic_properties(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "area":      rng.integers(300, 8000, n),
+        "bedrooms":  rng.integers(1, 7, n),
+        "bathrooms": rng.integers(1, 5, n),
+        "stories":   rng.integers(1, 4, n),
+        "parking":   rng.integers(0, 4, n),
+        "furnishing": rng.choice(["Fully Furnished", "Semi-Furnished", "Unfurnished"], n),
+    })
+    for f in AMENITY_FEATURES:
+        df[f] = rng.random(n) < 0.5
+    return df
+
+
+def benchmark_batch(n=10_000, loop_n=500):
+    """Rows/sec of the per-row build_input loop vs the batch path."""
+    df   = synthetic_properties(n)
+    rows = df.head(loop_n).to_dict("records")
+    t0 = time.perf_counter()
+    for r in rows:
+        model.predict(build_input(r))
+    loop_rate = len(rows) / (time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    predict_batch(df)
+    batch_rate = n / (time.perf_counter() - t0)
+    return {"rows": n, "loop_rows_per_s": loop_rate, "batch_rows_per_s": batch_rate,
+            "speedup": batch_rate / loop_rate}
+
+
+INSERT_PREDICTION = text("""
+    INSERT INTO predictions
+      (username,country,state,city,pincode,area,bedrooms,bathrooms,
+       stories,parking,mainroad,guestroom,basement,hotwaterheating,
+       airconditioning,prefarea,furnishing,predicted_price,price_per_sqft,
+       segment,lat,lon,media_paths,timestamp,model_version)
+    VALUES
+      (:username,:country,:state,:city,:pincode,:area,:bedrooms,:bathrooms,
+       :stories,:parking,:mainroad,:guestroom,:basement,:hotwaterheating,
+       :airconditioning,:prefarea,:furnishing,:price,:ppsf,
+       :segment,:lat,:lon,:media,:ts,:model_version)
+""")
+
+# The same insert as a Core statement that returns each row's id in parameter order
+# (one multi-row INSERT … RETURNING on PostgreSQL), so the writer can hand ids back.
+# Columns and bind names are read from INSERT_PREDICTION so the two cannot drift apart.
+_PREDICTION_BINDS = dict(zip(*(re.findall(r":?(\w+)", part) for part in
+    re.search(r"\(([^)]*)\)\s*VALUES\s*\(([^)]*)\)", INSERT_PREDICTION.text).groups())))
+_PREDICTIONS = Table("predictions", MetaData(), Column("id", Integer, primary_key=True),
+                     *(Column(c) for c in _PREDICTION_BINDS))
+INSERT_PREDICTION_ID = insert(_PREDICTIONS) \
+    .values({c: bindparam(b) for c, b in _PREDICTION_BINDS.items()}) \
+    .returning(_PREDICTIONS.c.id, sort_by_parameter_order=True)
+
+
+# ── WRITE-BEHIND PERSISTENCE ─────────────────────────────────────
+WRITE_BATCH_ROWS = int(os.getenv("WRITE_BATCH_ROWS", "200"))    # commit once this many rows are queued
+WRITE_BATCH_MS   = int(os.getenv("WRITE_BATCH_MS", "200"))      # …or once the oldest has waited this long
+WRITE_QUEUE_MAX  = int(os.getenv("WRITE_QUEUE_MAX", "10000"))   # put() blocks beyond this (backpressure)
+WRITE_JOURNAL    = os.getenv("WRITE_JOURNAL", "")               # optional local JSONL journal path
+WRITE_RETRIES    = int(os.getenv("WRITE_RETRIES", "8"))          # attempts before a rejected batch is split up
+WRITE_MAX_BACKOFF = float(os.getenv("WRITE_MAX_BACKOFF", "30"))  # seconds between retries while the DB is down
+WRITE_DEAD_LETTER = os.getenv("WRITE_DEAD_LETTER", "prediction_dead_letter.jsonl")   # rows that never commit
+READ_FLUSH_SECS  = 0.5   # how long a page render waits for queued valuations
+_FLUSH, _STOP    = object(), object()
+
+
+class PredictionWriter:
+    """Write-behind queue for prediction rows. One daemon thread group-commits
+    up to batch_rows rows per transaction, at least every batch_ms; put() blocks while
+    max_queue rows are waiting. An unreachable database (connection, lock or pool errors)
+    is retried for as long as it takes, backing off up to WRITE_MAX_BACKOFF, while the full
+    queue holds back new rows. A batch the database rejects `retries` times is retried row
+    by row; rows that fail alone go to the dead-letter JSONL file so one bad row can't
+    wedge the queue. put() returns a Future resolving to the row's id once committed (None
+    if it was dead-lettered, or if `statement` returns no ids). With a journal each row is
+    appended and fsynced locally before put() returns, and rows past the last marker are
+    replayed on start (at-least-once: a crash between a commit and its marker replays that
+    batch)."""
+
+    def __init__(self, statement=INSERT_PREDICTION_ID, batch_rows=WRITE_BATCH_ROWS, batch_ms=WRITE_BATCH_MS,
+                 max_queue=WRITE_QUEUE_MAX, journal=WRITE_JOURNAL, retries=WRITE_RETRIES,
+                 dead_letter=WRITE_DEAD_LETTER):
+        self.statement  = statement
+        self.batch_rows = batch_rows
+        self.batch_ms   = batch_ms
+        self.journal    = journal or None
+        self.retries    = retries
+        self.dead_letter = dead_letter
+        self._q         = queue.Queue(max_queue)
+        self._cv        = threading.Condition()
+        self._put_lock  = threading.Lock()   # journal order == queue order == commit order
+        self.enqueued   = 0      # rows accepted by put()
+        self.committed  = 0      # rows durably in the database
+        self.dead       = 0      # rows moved to the dead-letter file
+        self.failing    = False  # the current batch is in retry backoff
+        self.batches    = 0
+        self.blocked    = 0      # put() calls that hit a full queue
+        self.errors     = 0
+        self._jf        = None
+        self._jbase     = 0      # committed count when the journal was last emptied
+        if self.journal:
+            self._replay_journal()
+            self._jf = open(self.journal, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="prediction-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, row):
+        saved = Future()
+        with self._put_lock:
+            with self._cv:
+                self.enqueued += 1
+                if self._jf:
+                    self._jf.write(json.dumps({"row": row}, default=float) + "\n")
+                    self._jf.flush()
+                    os.fsync(self._jf.fileno())
+            if self._q.full():
+                self.blocked += 1
+            self._q.put((row, saved))
+        return saved
+
+    def flush(self, timeout=10.0):
+        """Commit everything put() so far; True once it is in the database (or dead-lettered).
+        Returns False at once while the writer is backing off from a failing database."""
+        with self._cv:
+            target = self.enqueued
+            if self._done() >= target:
+                return True
+            if self.failing:
+                return False
+        self._q.put(_FLUSH)
+        with self._cv:
+            return self._cv.wait_for(lambda: self._done() >= target or self.failing, timeout) \
+                and self._done() >= target
+
+    def _done(self):
+        return self.committed + self.dead
+
+    def close(self, timeout=10.0):
+        if self._thread.is_alive():
+            self.flush(timeout)
+            self._q.put(_STOP)
+            self._thread.join(timeout)
+        if self._jf:
+            self._jf.close()
+            self._jf = None
+
+    def stats(self):
+        return {"queued": self._q.qsize(), "enqueued": self.enqueued, "committed": self.committed,
+                "batches": self.batches, "avg_batch": self.committed / max(self.batches, 1),
+                "blocked": self.blocked, "errors": self.errors, "dead_lettered": self.dead}
+
+    def _run(self):
+        batch, stop = [], False
+        while not stop:
+            item = self._q.get()
+            deadline = time.monotonic() + self.batch_ms / 1000
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif item is not _FLUSH:
+                    batch.append(item)
+                if stop or item is _FLUSH or len(batch) >= self.batch_rows:
+                    break
+                try:
+                    item = self._q.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._commit(batch)
+                except Exception:   # the thread must survive: a dead writer would block put() forever
+                    log.exception("prediction writer: dropped %d row(s): %s",
+                                  len(batch), json.dumps([row for row, _ in batch], default=float))
+                    self._settle(0, len(batch))
+                    for _, saved in batch:
+                        if not saved.done():
+                            saved.set_result(None)
+                batch = []
+            elif not stop:
+                with self._cv:
+                    self._cv.notify_all()   # a flush with nothing pending
+
+    def _execute(self, items):
+        """Insert [(row, future)] in one transaction and resolve the futures; the error, or None."""
+        try:
+            with engine.begin() as con:
+                result = con.execute(self.statement, [row for row, _ in items])
+                ids    = result.scalars().all() if result.returns_rows else [None] * len(items)
+        except Exception as e:
+            self.errors += 1
+            return e
+        for (_, saved), pid in zip(items, ids):
+            saved.set_result(pid)
+        return None
+
+    @staticmethod
+    def _unreachable(err):
+        """The database is down, busy or out of connections, as opposed to rejecting a row."""
+        return isinstance(err, (OperationalError, DisconnectionError, PoolTimeout)) \
+            or getattr(err, "connection_invalidated", False)
+
+    def _commit(self, batch):
+        delay, rejected, pending, failed = 0.1, 0, batch, []
+        while True:
+            err = self._execute(pending)
+            if err is None:
+                break
+            if not self._unreachable(err):
+                rejected += 1
+                if rejected >= self.retries:   # the database is up but refuses something: isolate it
+                    retry = []
+                    for row in pending:
+                        e = self._execute([row])
+                        if e is not None:
+                            (retry if self._unreachable(e) else failed).append(row)
+                    if not retry:
+                        break
+                    pending, rejected = retry, 0   # went down mid-way: the rest waits for it
+            with self._cv:
+                self.failing = True
+                self._cv.notify_all()    # let waiting flushes give up instead of blocking
+            log.warning("prediction writer: %s (%s, retrying in %.1fs)", err,
+                        "database unreachable" if self._unreachable(err) else f"rejected {rejected}/{self.retries}",
+                        delay)
+            time.sleep(delay)
+            delay = min(delay * 2, WRITE_MAX_BACKOFF)
+        if failed:
+            rows = [row for row, _ in failed]
+            try:
+                self._dead_letter(rows)
+            except OSError as e:
+                log.error("prediction writer: cannot write %s (%s); rows: %s",
+                          self.dead_letter, e, json.dumps(rows, default=float))
+        self._settle(len(batch) - len(failed), len(failed))
+        for _, saved in failed:
+            saved.set_result(None)
+
+    def _settle(self, committed, dead):
+        with self._cv:
+            self.failing    = False
+            self.committed += committed
+            self.dead      += dead
+            self.batches   += 1
+            if self._jf:
+                self._jf.write(json.dumps({"committed": self._done() - self._jbase}) + "\n")
+                self._jf.flush()
+                if self._done() == self.enqueued:   # nothing in flight: start a fresh journal
+                    self._jf.truncate(0)
+                    self._jbase = self._done()
+            self._cv.notify_all()
+
+    def _dead_letter(self, rows):
+        log.error("prediction writer: %d row(s) rejected by the database; written to %s",
+                  len(rows), self.dead_letter)
+        with open(self.dead_letter, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({"row": row, "at": time.time()}, default=float) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal):
+            return
+        rows, done = [], 0
+        with open(self.journal, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break                      # torn final line from a crash mid-write
+                if "row" in rec:
+                    rows.append(rec["row"])
+                else:
+                    done = rec["committed"]
+        pending = rows[done:]
+        if pending:
+            with engine.begin() as con:
+                con.execute(self.statement, pending)
+            log.info("prediction writer: replayed %d journaled rows", len(pending))
+        os.remove(self.journal)
+
+
+@st.cache_resource
+def get_prediction_writer():
+    writer = PredictionWriter()
+    atexit.register(writer.close)   # drain the queue on a clean shutdown
+    return writer
+
+
+prediction_writer = get_prediction_writer()
+
+
+def save_prediction(username, inp, price, segment, lat, lon, media_paths="", model_version=None):
+    """Queue the row for the write-behind writer; the valuation never waits on the database.
+    Returns a Future of the row's id (None if the row could not be saved)."""
     ppsf = price / inp["area"] if inp["area"] else 0
+    return prediction_writer.put({
+        "username":username,"country":inp["country"],"state":inp["state"],
+        "city":inp["city"],"pincode":inp["pincode"],"area":inp["area"],
+        "bedrooms":inp["bedrooms"],"bathrooms":inp["bathrooms"],"stories":inp["stories"],
+        "parking":inp["parking"],"mainroad":int(inp["mainroad"]),"guestroom":int(inp["guestroom"]),
+        "basement":int(inp["basement"]),"hotwaterheating":int(inp["hotwaterheating"]),
+        "airconditioning":int(inp["airconditioning"]),"prefarea":int(inp["prefarea"]),
+        "furnishing":inp["furnishing"],"price":price,"ppsf":ppsf,
+        "segment":segment,"lat":lat,"lon":lon,"media":media_paths,
+        "ts":datetime.now().strftime("%Y-%m-%d %H:%M:%S"),"model_version":model_version,
+    })
+
+
+def save_predictions_bulk(rows):
+    """executemany of INSERT_PREDICTION rows in a single transaction."""
+    if rows:
+        with engine.begin() as con:
+            con.execute(INSERT_PREDICTION, rows)
+
+
+# ── STORAGE LOAD TEST ────────────────────────────────────────────
+LOAD_TEST_TABLE = "load_test"   # scratch copy of predictions' columns; dropped afterwards
+
+
+def load_test(users=8, ops_per_user=200, write_ratio=0.2, write_behind=False):
+    """Concurrent simulated sessions against the live engine. Each thread mixes
+    INSERT_PREDICTION-shaped writes (into a scratch table, so analytics are untouched)
+    with the Analytics tab's newest-page read. write_behind routes the writes through a
+    PredictionWriter, as save_prediction does; its final drain counts toward the time."""
+    insert = text(INSERT_PREDICTION.text.replace("INTO predictions", f"INTO {LOAD_TEST_TABLE}"))
+    read   = text(f"SELECT {RECORD_COLS} FROM predictions ORDER BY timestamp DESC, id DESC LIMIT :n")
+    row = {"country": "India", "state": "Maharashtra", "city": "Pune", "pincode": "411001",
+           "area": 1200, "bedrooms": 3, "bathrooms": 2, "stories": 1, "parking": 1,
+           "mainroad": 1, "guestroom": 0, "basement": 0, "hotwaterheating": 0,
+           "airconditioning": 1, "prefarea": 0, "furnishing": "Semi-Furnished",
+           "price": 5_000_000.0, "ppsf": 4166.7, "segment": "Mid-Range", "lat": 18.52, "lon": 73.86,
+           "media": "", "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "model_version": MODEL_VERSION}
+    with engine.begin() as con:
+        con.execute(text(f"DROP TABLE IF EXISTS {LOAD_TEST_TABLE}"))
+        con.execute(text(f"CREATE TABLE {LOAD_TEST_TABLE} AS SELECT * FROM predictions WHERE 1 = 0"))
+    writer = PredictionWriter(insert, journal=None) if write_behind else None
+
+    def session(i):
+        rng, lat, errors = np.random.default_rng(i), [], 0
+        for _ in range(ops_per_user):
+            t0 = time.perf_counter()
+            try:
+                if rng.random() >= write_ratio:
+                    with engine.connect() as con:
+                        con.execute(read, {"n": PAGE_SIZE}).fetchall()
+                elif writer:
+                    writer.put({**row, "username": f"load{i}"})
+                else:
+                    with engine.begin() as con:
+                        con.execute(insert, {**row, "username": f"load{i}"})
+            except Exception as e:
+                errors += 1
+                log.warning("load test: %s", e)
+            lat.append(time.perf_counter() - t0)
+        return lat, errors
+
+    t0 = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(users, thread_name_prefix="load") as pool:
+            results = list(pool.map(session, range(users)))
+        if writer:
+            writer.close()
+    finally:
+        with engine.begin() as con:
+            con.execute(text(f"DROP TABLE IF EXISTS {LOAD_TEST_TABLE}"))
+    wall = time.perf_counter() - t0
+    lat  = np.concatenate([np.asarray(r[0]) for r in results]) * 1000
+    return {"users": users, "writes": "write-behind" if write_behind else "direct",
+            "ops": len(lat), "ops_per_s": len(lat) / wall,
+            "p50_ms": float(np.percentile(lat, 50)), "p95_ms": float(np.percentile(lat, 95)),
+            "errors": sum(r[1] for r in results)}
+
+
+# ── THUMBNAILS ───────────────────────────────────────────────────
+def make_thumbnail(data):
+    """Bounded-size WebP thumbnail of image bytes, stored once under THUMB_DIR by content hash."""
+    digest = hashlib.sha256(data).hexdigest()
+    name   = f"{digest}.webp"
+    dest   = os.path.join(THUMB_DIR, name)
+    if not os.path.exists(dest):
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with Image.open(io.BytesIO(data)) as im:
+                im = ImageOps.exif_transpose(im).convert("RGB")
+                im.thumbnail(THUMB_SIZE)
+                im.save(tmp, "WEBP", quality=75, method=4)
+            os.replace(tmp, dest)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return digest, name
+
+
+# ── MEDIA INGESTION ──────────────────────────────────────────────
+# Uploads are copied to MEDIA_DIR chunk by chunk on the background pool, named by
+# kind + SHA-256 so the same file is stored once however often it is uploaded.
+MEDIA_CHUNK      = 1 << 20
+MEDIA_MAX_PHOTO  = int(os.getenv("MEDIA_MAX_PHOTO_MB", "20")) << 20
+MEDIA_MAX_VIDEO  = int(os.getenv("MEDIA_MAX_VIDEO_MB", "200")) << 20
+MEDIA_USER_QUOTA = int(os.getenv("MEDIA_USER_QUOTA_MB", "1024")) << 20
+PHOTO_EXTS       = (".jpg", ".jpeg", ".png", ".webp")
+
+
+class MediaRejected(ValueError):
+    pass
+
+
+def media_limit(name):
+    return MEDIA_MAX_PHOTO if name.lower().endswith(PHOTO_EXTS) else MEDIA_MAX_VIDEO
+
+
+def media_usage(username):
     with engine.connect() as con:
-        con.execute(text("""
-            INSERT INTO predictions
-              (username,country,state,city,pincode,area,bedrooms,bathrooms,
-               stories,parking,mainroad,guestroom,basement,hotwaterheating,
-               airconditioning,prefarea,furnishing,predicted_price,price_per_sqft,
-               segment,lat,lon,media_paths,timestamp)
-            VALUES
-              (:username,:country,:state,:city,:pincode,:area,:bedrooms,:bathrooms,
-               :stories,:parking,:mainroad,:guestroom,:basement,:hotwaterheating,
-               :airconditioning,:prefarea,:furnishing,:price,:ppsf,
-               :segment,:lat,:lon,:media,:ts)
-        """), {
-            "username":username,"country":inp["country"],"state":inp["state"],
-            "city":inp["city"],"pincode":inp["pincode"],"area":inp["area"],
-            "bedrooms":inp["bedrooms"],"bathrooms":inp["bathrooms"],"stories":inp["stories"],
-            "parking":inp["parking"],"mainroad":int(inp["mainroad"]),"guestroom":int(inp["guestroom"]),
-            "basement":int(inp["basement"]),"hotwaterheating":int(inp["hotwaterheating"]),
-            "airconditioning":int(inp["airconditioning"]),"prefarea":int(inp["prefarea"]),
-            "furnishing":inp["furnishing"],"price":price,"ppsf":ppsf,
-            "segment":segment,"lat":lat,"lon":lon,"media":media_paths,
-            "ts":datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-        con.commit()
+        used = con.execute(text("SELECT bytes FROM media_usage WHERE username=:u"),
+                           {"u": username}).scalar()
+    return int(used or 0)
+
+
+def _charge_media(username, n):
+    """Atomically add n bytes to the user's usage; False if that would exceed the quota."""
+    with engine.begin() as con:
+        con.execute(text("INSERT INTO media_usage VALUES (:u, 0) ON CONFLICT(username) DO NOTHING"),
+                    {"u": username})
+        return con.execute(text("UPDATE media_usage SET bytes = bytes + :n "
+                                "WHERE username=:u AND bytes + :n <= :q"),
+                           {"u": username, "n": n, "q": MEDIA_USER_QUOTA}).rowcount == 1
+
+
+def _refund_media(username, n):
+    with engine.begin() as con:
+        con.execute(text("UPDATE media_usage SET bytes = bytes - :n WHERE username=:u"),
+                    {"u": username, "n": n})
+
+
+def store_media(src, kind, ext, limit):
+    """Stream a file-like object into MEDIA_DIR as <kind>_<sha256><ext>, hashing as it
+    goes. Returns (name, sha256, newly_stored); raises MediaRejected past `limit` bytes."""
+    digest, size = hashlib.sha256(), 0
+    tmp = os.path.join(MEDIA_DIR, f".{secrets.token_hex(8)}.part")
+    try:
+        src.seek(0)
+        with open(tmp, "wb") as out:
+            for chunk in iter(lambda: src.read(MEDIA_CHUNK), b""):
+                size += len(chunk)
+                if size > limit:
+                    raise MediaRejected(f"larger than {limit >> 20} MB")
+                digest.update(chunk)
+                out.write(chunk)
+        digest = digest.hexdigest()
+        name   = f"{kind}_{digest}{ext}"
+        dest   = os.path.join(MEDIA_DIR, name)
+        if os.path.exists(dest):
+            os.remove(tmp)
+            return name, digest, False
+        os.replace(tmp, dest)
+        return name, digest, True
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def media_kind(name):
+    return "photo" if name.lower().endswith(PHOTO_EXTS) else "video"
+
+
+def describe_media(name, kind, digest=None):
+    """`media` row values for a file in MEDIA_DIR. Photos are hashed, measured and
+    thumbnailed here; videos only get hashed, and only if `digest` isn't known."""
+    fp  = os.path.join(MEDIA_DIR, name)
+    row = {"name": name, "kind": kind, "bytes": os.path.getsize(fp), "w": None, "h": None, "thumb": None}
+    if kind == "photo":
+        with open(fp, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        try:
+            with Image.open(io.BytesIO(data)) as im:
+                w, h = im.size
+                row["w"], row["h"] = (h, w) if im.getexif().get(0x0112) in (5, 6, 7, 8) else (w, h)
+            row["thumb"] = make_thumbnail(data)[1]
+        except Exception:
+            pass   # undecodable image: keep the file, skip dimensions and thumbnail
+    elif digest is None:
+        h = hashlib.sha256()
+        with open(fp, "rb") as f:
+            for chunk in iter(lambda: f.read(MEDIA_CHUNK), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+    row["sha"] = digest
+    return row
+
+
+INSERT_MEDIA = text("""
+    INSERT INTO media (prediction_id, sha256, kind, name, width, height, bytes, thumb, created)
+    VALUES (:pid, :sha, :kind, :name, :w, :h, :bytes, :thumb, :created)
+    ON CONFLICT (prediction_id, sha256) DO NOTHING""")
+
+
+def _store_uploads(username, uploads):
+    """Store each upload, charging the user's quota for bytes that actually land on disk.
+    Returns ([media row], [(file, reason)], bytes charged)."""
+    rows, rejected, charged = [], [], 0
+    for up in uploads:
+        ext  = os.path.splitext(up.name)[1].lower()
+        kind = media_kind(ext)
+        if not _charge_media(username, up.size):
+            rejected.append((up.name, f"storage quota of {MEDIA_USER_QUOTA >> 20} MB reached"))
+            continue
+        try:
+            name, digest, new = store_media(up, kind, ext, media_limit(up.name))
+        except (MediaRejected, OSError) as e:
+            _refund_media(username, up.size)
+            rejected.append((up.name, str(e)))
+            continue
+        if new:
+            charged += up.size
+        else:
+            _refund_media(username, up.size)   # already stored: no new bytes on disk
+        if all(r["name"] != name for r in rows):
+            rows.append({**describe_media(name, kind, digest), "upload": up.name, "new": new})
+    return rows, rejected, charged
+
+
+def _link_media(username, stored, pid):
+    """Record stored uploads in `media` against prediction `pid`. With no pid (the
+    valuation was not saved) refund the charge and delete the files this upload added,
+    unless a `media` row has claimed them since."""
+    rows, rejected, charged = stored
+    if pid is None:
+        if charged:
+            _refund_media(username, charged)
+        with engine.connect() as con:   # a thumbnail is named by its photo's sha256, so one lookup covers both
+            for r in rows:
+                claimed = con.execute(text("SELECT 1 FROM media WHERE sha256=:s"), {"s": r["sha"]}).first()
+                if r["new"] and claimed is None:
+                    os.remove(os.path.join(MEDIA_DIR, r["name"]))
+                    if r["thumb"]:
+                        os.remove(os.path.join(THUMB_DIR, r["thumb"]))
+        return [], rejected + [(r["upload"], "the valuation was not saved") for r in rows]
+    if rows:
+        created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with engine.begin() as con:
+            con.execute(INSERT_MEDIA, [{**r, "pid": pid, "created": created} for r in rows])
+    return [r["name"] for r in rows], rejected
+
+
+def ingest_media(username, uploads, saved):
+    """Store the uploads on the background pool, then record them in `media` against the
+    valuation once `saved` (the writer's Future of its row id) resolves. No worker waits
+    on the database meanwhile: the link step is only queued when the id is known.
+    Returns a Future of (names, [(file, reason)])."""
+    linked = Future()
+
+    def link(stored):
+        try:
+            linked.set_result(_link_media(username, stored.result(), saved.result()))
+        except BaseException as e:
+            linked.set_exception(e)
+
+    stored = background.submit(_store_uploads, username, uploads)
+    stored.add_done_callback(lambda _: saved.add_done_callback(lambda _: background.submit(link, stored)))
+    return linked
+
+
+def backfill_media(batch=200):
+    """Move legacy comma-joined predictions.media_paths into `media`, one pass per start.
+    Migrated names are cleared from the string; names whose file is missing on disk stay
+    there, so they are retried next start. Safe to run from several processes at once:
+    the (prediction_id, sha256) unique index turns repeated inserts into no-ops."""
+    after = 0
+    while True:
+        with engine.connect() as con:
+            found = con.execute(text("""
+                SELECT id, media_paths, timestamp FROM predictions
+                WHERE id > :after AND media_paths IS NOT NULL AND media_paths != ''
+                ORDER BY id LIMIT :n"""), {"after": after, "n": batch}).all()
+        if not found:
+            return
+        after = found[-1][0]
+        rows, keep = [], []
+        for pid, paths, ts in found:
+            missing = []
+            for name in dict.fromkeys(p.strip() for p in paths.split(",") if p.strip()):
+                if os.path.isfile(os.path.join(MEDIA_DIR, name)):
+                    rows.append({**describe_media(name, media_kind(name)), "pid": pid, "created": ts or ""})
+                else:
+                    missing.append(name)
+            keep.append({"id": pid, "m": ",".join(missing)})
+        with engine.begin() as con:
+            if rows:
+                con.execute(INSERT_MEDIA, rows)
+            con.execute(text("UPDATE predictions SET media_paths=:m WHERE id=:id"), keep)
+        log.info("media backfill: %d files from %d predictions (%d missing on disk)",
+                 len(rows), len(found), sum(len(k["m"].split(",")) for k in keep if k["m"]))
+
+
+@st.cache_resource
+def get_media_backfill():
+    return background.submit(backfill_media)
+
+
+get_media_backfill()
+
+
+# ── BULK IMPORT ──────────────────────────────────────────────────
+BULK_CHUNK    = 5_000
+BULK_REQUIRED = ("area", "bedrooms", "bathrooms", "stories", "parking", "furnishing")
+
+
+def iter_upload_chunks(upload, chunk_size=BULK_CHUNK):
+    """Yield (DataFrame chunk, fraction done) from a CSV/Parquet upload, chunk by chunk."""
+    if upload.name.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+        pf    = pq.ParquetFile(upload)
+        total = max(pf.metadata.num_rows, 1)
+        done  = 0
+        for batch in pf.iter_batches(batch_size=chunk_size):
+            df    = batch.to_pandas()
+            done += len(df)
+            yield df, done / total
+    else:
+        size = max(upload.size, 1)
+        for df in pd.read_csv(upload, chunksize=chunk_size):
+            yield df, min(upload.tell() / size, 1.0)
+
+
+def score_chunk(df, username):
+    """Score one upload chunk. Returns (INSERT_PREDICTION parameter rows, places that
+    need an upstream geocode once the rows are in the database)."""
+    df  = df.rename(columns=lambda c: str(c).strip().lower()).reset_index(drop=True)
+    n   = len(df)
+    val = predict_batch(df)
+
+    def col(name, default):
+        return df[name].fillna(default) if name in df else pd.Series([default] * n)
+
+    out = pd.DataFrame({
+        "username": username,
+        "country":  col("country", "").astype(str),
+        "state":    col("state", "").astype(str),
+        "city":     col("city", "").astype(str),
+        "pincode":  col("pincode", "").astype(str),
+        "area":     pd.to_numeric(df["area"], errors="coerce").fillna(0).astype(float),
+    })
+    for f in ("bedrooms", "bathrooms", "stories", "parking"):
+        out[f] = pd.to_numeric(df[f], errors="coerce").fillna(0).astype(int)
+    for f in AMENITY_FEATURES:
+        out[f] = _as_flag(df[f]).astype(int) if f in df else 0
+    out["furnishing"] = df["furnishing"].astype(str)
+    out["price"]      = val["predicted_price"]
+    out["ppsf"]       = val["price_per_sqft"]
+    out["segment"]    = val["segment"]
+    out["lat"]        = pd.to_numeric(col("lat", 0.0), errors="coerce").fillna(0.0).astype(float)
+    out["lon"]        = pd.to_numeric(col("lon", 0.0), errors="coerce").fillna(0.0).astype(float)
+    need = ((out["lat"] == 0) | (out["lon"] == 0)) & (out["city"].str.strip() != "")
+    pending = set()
+    if need.any():
+        places = list(zip(out.loc[need, "city"], out.loc[need, "state"], out.loc[need, "country"]))
+        coords = geocode_many(places, network=False)
+        out.loc[need, ["lat", "lon"]] = np.array([coords.get(t, (0.0, 0.0)) for t in places], dtype=np.float64)
+        pending = {t for t in places if t not in coords}
+    out["media"]      = ""
+    out["ts"]         = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    out["model_version"] = MODEL_VERSION
+    return out.to_dict("records"), pending
+
+
+def bulk_import(upload, username, chunk_size=BULK_CHUNK, on_progress=None):
+    """Stream, score and insert an upload one transaction per chunk. Returns (rows, seconds)."""
+    rows, t0 = 0, time.perf_counter()
+    for df, frac in iter_upload_chunks(upload, chunk_size):
+        missing = [c for c in BULK_REQUIRED if c not in {str(x).strip().lower() for x in df.columns}]
+        if missing:
+            raise ValueError(f"Missing column(s): {', '.join(missing)}")
+        chunk, pending = score_chunk(df, username)
+        save_predictions_bulk(chunk)
+        if pending:   # only now are there rows for the backfill's UPDATE to find
+            background.submit(backfill_locations, sorted(pending))
+        rows += len(df)
+        if on_progress:
+            on_progress(frac, rows, time.perf_counter() - t0)
+    return rows, time.perf_counter() - t0
+
+
+@st.cache_resource
+def get_location_sweeper():
+    """sweep_missing_locations on the background pool now and every GEO_SWEEP_SECS."""
+    def tick():
+        try:
+            sweep_missing_locations()
+        except Exception as e:
+            log.warning("location sweep: %s", e)
+        timer = threading.Timer(GEO_SWEEP_SECS, background.submit, (tick,))
+        timer.daemon = True
+        timer.start()
+    return background.submit(tick)
+
+
+get_location_sweeper()
 
 
 # ── SESSION STATE ────────────────────────────────────────────────
 defaults = {
     "logged_in": False, "user": "", "page": "login",
     "auto_city": "", "auto_lat": 0.0, "auto_lon": 0.0, "_last_pin": "",
-    "result": None
+    "result": None, "rec_cursors": (None,), "map_view": None,
 }
 for k, v in defaults.items():
     if k not in st.session_state:
         st.session_state[k] = v
 
+# A new browser session (reload, new tab) resumes from its token instead of the login form.
+if not st.session_state.logged_in and SESSION_PARAM in st.query_params:
+    resumed, token = rotate_session(st.query_params[SESSION_PARAM])
+    if resumed:
+        st.session_state.logged_in, st.session_state.user = True, resumed
+        st.query_params[SESSION_PARAM] = token
+    else:
+        del st.query_params[SESSION_PARAM]
+
 # ════════════════════════════════════════════════════════════════
 #  AUTH SCREENS — Deep navy + electric blue + coral accent
 # ════════════════════════════════════════════════════════════════
@@ -817,10 +2879,11 @@ if not st.session_state.logged_in:
                 if not lu or not lp:
                     st.error("enter your username and password.")
                 else:
-                    ok, msg = login_user(lu, lp)
+                    ok, msg = login_user(lu, lp, client_id())
                     if ok:
                         st.session_state.logged_in = True
                         st.session_state.user = lu
+                        st.query_params[SESSION_PARAM] = create_session(lu)
                         st.rerun()
                     else:
                         st.error(f"❌ {msg}")
@@ -847,6 +2910,12 @@ if not st.session_state.logged_in:
             """, unsafe_allow_html=True)
 
             ru  = st.text_input("Username",         placeholder="Choose a username",      key="re_u")
+            if ru.strip():
+                taken = user_exists(ru)
+                st.markdown(f"<div style='font-size:13px;font-weight:700;margin-top:-8px;"
+                            f"color:{'#ff3d6b' if taken else '#00c896'};'>"
+                            f"{'✗ Username already taken' if taken else '✓ Username available'}</div>",
+                            unsafe_allow_html=True)
             rp  = st.text_input("Password",         type="password", placeholder="Min 6 characters", key="re_p")
             rp2 = st.text_input("Confirm Password", type="password", placeholder="Repeat password",   key="re_p2")
             st.markdown("<br>", unsafe_allow_html=True)
@@ -857,14 +2926,14 @@ if not st.session_state.logged_in:
                 elif rp != rp2:
                     st.error("Passwords do not match.")
                 else:
-                    ok, _ = register_user(ru, rp)
+                    ok, msg = register_user(ru, rp, client_id())
                     if ok:
                         st.success("Account created! Please log in.")
                         time.sleep(1.5)
                         st.session_state.page = "login"
                         st.rerun()
                     else:
-                        st.error("Username already taken.")
+                        st.error(msg)
 
             if st.button("Back to Login", use_container_width=True, key="back_login"):
                 st.session_state.page = "login"
@@ -875,6 +2944,13 @@ if not st.session_state.logged_in:
 # ════════════════════════════════════════════════════════════════
 #  MAIN DASHBOARD
 # ════════════════════════════════════════════════════════════════
+st.markdown(DASHBOARD_CSS, unsafe_allow_html=True)
+
+# The model is first loaded here, not at import, so the login screen never waits on it.
+with startup_phase("model"):
+    model_registry = get_model_registry()
+# One snapshot per run: a swap mid-run never mixes two model versions in one valuation.
+model, MODEL_COLS, MODEL_VERSION = model_registry.current()
 
 # ── VIBRANT TOP NAV BAR ──────────────────────────────────────────
 st.markdown(f"""
@@ -901,26 +2977,420 @@ st.markdown("<div style='height:16px'></div>", unsafe_allow_html=True)
 
 
 
-@st.cache_data(ttl=60)
-def get_history():
+# ── HISTORY QUERIES — each consumer selects only what it needs ──
+PAGE_SIZE   = 50
+RECORD_COLS = "id, timestamp, city, state, area, bedrooms, bathrooms, furnishing, predicted_price, segment"
+
+
+def _read_sql(q, params=None):
     try:
-        # Use an explicit connection context manager to ensure it closes
         with engine.connect() as con:
-            return pd.read_sql(text("SELECT * FROM predictions ORDER BY timestamp DESC"), con)
+            return pd.read_sql(text(q), con, params=params or {})
     except Exception:
         return pd.DataFrame()
 
 
-df_hist = get_history()
+ANALYTICS_LAG_IDS        = int(os.getenv("ANALYTICS_LAG_IDS", "2000"))         # ids kept open below the newest
+ANALYTICS_RECOMPUTE_SECS = float(os.getenv("ANALYTICS_RECOMPUTE_SECS", "600"))  # full rebuild interval
+
+
+class AnalyticsCache:
+    """Running dashboard aggregates. refresh() folds in only rows it has not seen, so a new
+    valuation costs O(new rows) for every viewer instead of a full re-read.
+
+    PostgreSQL hands out ids at INSERT but rows appear at COMMIT, so with several writers
+    id 41 can show up after id 42. Ids within ANALYTICS_LAG_IDS of the newest therefore stay
+    open: the ones already folded are remembered and late arrivals are added. Anything later
+    than that, and deleted rows, are caught by a full recompute every ANALYTICS_RECOMPUTE_SECS."""
+
+    def __init__(self):
+        self._lock   = threading.Lock()
+        self.version = 0   # bumped whenever the aggregates change; keys the row-level caches
+        self._reset()
+
+    def _reset(self):
+        self.high_water  = 0
+        self.settled     = None  # every id <= settled is folded in; None forces a rebuild
+        self._recent     = set() # folded ids above settled
+        self.n           = 0
+        self.sum_price   = 0.0
+        self.sum_area    = 0.0
+        self.sum_ppsf    = 0.0
+        self.by_segment  = {}   # segment -> count
+        self.by_state    = {}   # (state, segment) -> [count, sum_price]
+        self._built      = time.monotonic()
+
+    def _fold(self, state, segment, n, s_price, s_area, s_ppsf):
+        self.n         += n
+        self.sum_price += s_price or 0.0
+        self.sum_area  += s_area  or 0.0
+        self.sum_ppsf  += s_ppsf  or 0.0
+        self.by_segment[segment] = self.by_segment.get(segment, 0) + n
+        acc = self.by_state.setdefault((state, segment), [0, 0.0])
+        acc[0] += n
+        acc[1] += s_price or 0.0
+
+    def _rebuild(self):
+        top = _read_sql("SELECT MAX(id) AS mx FROM predictions")
+        if top.empty:
+            return False   # query failed: keep serving the old numbers
+        mx = top.mx[0]
+        self._reset()
+        self.settled = max(int(mx) - ANALYTICS_LAG_IDS, 0) if pd.notna(mx) else 0
+        for r in _read_sql("""
+                SELECT state, segment, COUNT(*) AS n, SUM(predicted_price) AS s_price,
+                       SUM(area) AS s_area, SUM(price_per_sqft) AS s_ppsf
+                FROM predictions WHERE id <= :s GROUP BY state, segment""",
+                {"s": self.settled}).itertuples():
+            self._fold(r.state, r.segment, int(r.n), r.s_price, r.s_area, r.s_ppsf)
+        self.high_water = self.settled
+        return True
+
+    def refresh(self):
+        with self._lock:
+            changed = False
+            if self.settled is None or time.monotonic() - self._built > ANALYTICS_RECOMPUTE_SECS:
+                changed = self._rebuild()
+                if self.settled is None:
+                    return self.version
+            # Cheap index-range probe first; the open rows are only read when something arrived.
+            probe = _read_sql("SELECT COUNT(*) AS n FROM predictions WHERE id > :s",
+                              {"s": self.settled})
+            if not probe.empty and int(probe.n[0]) != len(self._recent):
+                rows = _read_sql("""
+                    SELECT id, state, segment, predicted_price, area, price_per_sqft
+                    FROM predictions WHERE id > :s""", {"s": self.settled})
+                for r in rows.itertuples():
+                    if r.id in self._recent:
+                        continue
+                    self._fold(r.state, r.segment, 1, r.predicted_price, r.area, r.price_per_sqft)
+                    self._recent.add(int(r.id))
+                    self.high_water = max(self.high_water, int(r.id))
+                    changed = True
+                settled = self.high_water - ANALYTICS_LAG_IDS
+                if settled > self.settled:
+                    self.settled = settled
+                    self._recent = {i for i in self._recent if i > settled}
+            if changed:
+                self.version += 1
+            return self.version
+
+    def kpis(self):
+        with self._lock:
+            n = max(self.n, 1)
+            return {"n": self.n, "avg_price": self.sum_price / n,
+                    "avg_area": self.sum_area / n, "avg_ppsf": self.sum_ppsf / n}
+
+    def state_segment_summary(self):
+        with self._lock:
+            rows = [(state, seg, c, tot / c) for (state, seg), (c, tot) in self.by_state.items()]
+        return pd.DataFrame(rows, columns=["state", "segment", "n", "avg_price"]) \
+                 .sort_values(["state", "segment"], key=lambda c: c.astype(str))
+
+    def segment_counts(self):
+        with self._lock:
+            rows = sorted(self.by_segment.items(), key=lambda kv: str(kv[0]))
+        return pd.DataFrame(rows, columns=["segment", "count"])
 
-tab_val, tab_analytics, tab_map = st.tabs([
-    " Valuation", " Analytics", " Map"
-])
+
+@st.cache_resource
+def get_analytics_cache():
+    return AnalyticsCache()
+
+
+def get_scatter_rows(version):   # only read by get_analytics_figures, which caches the result
+    return _read_sql("""
+        SELECT area, predicted_price, segment, city, bedrooms, furnishing
+        FROM predictions""")
+
+
+SCATTER_MAX_POINTS  = int(os.getenv("SCATTER_MAX_POINTS", "20000"))  # point budget; above it Sample/Density
+SCATTER_WEBGL_MIN   = 2_000    # from here on render with scattergl
+SCATTER_MIN_SEGMENT = 200      # sample floor per segment, so rare segments stay visible
+SCATTER_OUTLIERS    = 20       # per segment: k highest, lowest priced and largest always kept
+SCATTER_BINS        = int(os.getenv("SCATTER_BINS", "60"))            # density grid cells per axis
+SCATTER_RESAMPLE_ROWS = int(os.getenv("SCATTER_RESAMPLE_ROWS", "1000"))  # whole-table reads re-run after this many new rows
+SCATTER_TTL           = int(os.getenv("SCATTER_TTL", "300"))             # … or after this many seconds
+
+
+def resample_key(version):
+    """Cache key for reads that scan the whole table (scatter Sample/Density, furnishing
+    quartiles, map centre): the data version while the table is under SCATTER_RESAMPLE_ROWS
+    rows, then the row count in SCATTER_RESAMPLE_ROWS buckets, so single valuations don't
+    re-run them. Their caches also expire after SCATTER_TTL to catch a slow trickle."""
+    n = analytics.kpis()["n"]
+    return ("version", version) if n < SCATTER_RESAMPLE_ROWS else ("rows", n // SCATTER_RESAMPLE_ROWS)
+
+
+@st.cache_data(max_entries=2, ttl=SCATTER_TTL)
+def get_furnishing_quantiles(version):
+    # Nearest-rank quartiles via window functions — portable across SQLite 3.25+ and PostgreSQL.
+    return _read_sql("""
+        WITH ranked AS (
+            SELECT furnishing, predicted_price AS p,
+                   ROW_NUMBER() OVER (PARTITION BY furnishing ORDER BY predicted_price) AS rn,
+                   COUNT(*)     OVER (PARTITION BY furnishing)                          AS n
+            FROM predictions WHERE predicted_price IS NOT NULL)
+        SELECT furnishing, MAX(n) AS n, AVG(p) AS mean, MIN(p) AS min,
+               MAX(CASE WHEN rn <= 1 + (n - 1) * 0.25 THEN p END) AS q1,
+               MAX(CASE WHEN rn <= 1 + (n - 1) * 0.50 THEN p END) AS median,
+               MAX(CASE WHEN rn <= 1 + (n - 1) * 0.75 THEN p END) AS q3,
+               MAX(p) AS max
+        FROM ranked GROUP BY furnishing ORDER BY furnishing""")
+
+
+def get_scatter_sample(version, budget=SCATTER_MAX_POINTS):
+    """Stratified systematic sample: each segment gets its share of the point budget (at least
+    SCATTER_MIN_SEGMENT), spread evenly over id order, plus its SCATTER_OUTLIERS extremes.
+    Row count is bounded by the budget, not the table size."""
+    return _read_sql("""
+        WITH ranked AS (
+            SELECT area, predicted_price, segment, city, bedrooms, furnishing,
+                   COUNT(*)     OVER ()                                                   AS total,
+                   COUNT(*)     OVER (PARTITION BY segment)                               AS n,
+                   ROW_NUMBER() OVER (PARTITION BY segment ORDER BY id)                   AS rn,
+                   ROW_NUMBER() OVER (PARTITION BY segment ORDER BY predicted_price DESC) AS hi,
+                   ROW_NUMBER() OVER (PARTITION BY segment ORDER BY predicted_price)      AS lo,
+                   ROW_NUMBER() OVER (PARTITION BY segment ORDER BY area DESC)            AS big
+            FROM predictions),
+        quota AS (
+            SELECT *, CASE WHEN n * :budget / total > :floor THEN n * :budget / total
+                           ELSE :floor END AS q
+            FROM ranked)
+        SELECT area, predicted_price, segment, city, bedrooms, furnishing FROM quota
+        WHERE rn * q / n > (rn - 1) * q / n          -- the row where floor(rn·q/n) steps up
+           OR hi <= :k OR lo <= :k OR big <= :k""",
+        {"budget": budget, "floor": SCATTER_MIN_SEGMENT, "k": SCATTER_OUTLIERS})
+
+
+def get_scatter_density(version, bins=SCATTER_BINS):
+    """area × price counts on a bins × bins grid, aggregated in SQL — at most (bins+1)² cells."""
+    empty = pd.DataFrame(columns=["area", "price", "n"])
+    ext = _read_sql("""
+        SELECT MIN(area) AS a0, MAX(area) AS a1, MIN(predicted_price) AS p0, MAX(predicted_price) AS p1
+        FROM predictions WHERE area IS NOT NULL AND predicted_price IS NOT NULL""")
+    if ext.empty or pd.isna(ext.a0[0]):   # query failed, or nothing to plot
+        return empty
+    ext = ext.iloc[0]
+    astep = float((ext.a1 - ext.a0) / bins) or 1.0
+    pstep = float((ext.p1 - ext.p0) / bins) or 1.0
+    df = _read_sql("""
+        SELECT ax, py, COUNT(*) AS n FROM (
+            SELECT ROUND(area / :astep) AS ax, ROUND(predicted_price / :pstep) AS py
+            FROM predictions WHERE area IS NOT NULL AND predicted_price IS NOT NULL) cells
+        GROUP BY ax, py""", {"astep": astep, "pstep": pstep})
+    if df.empty:
+        return empty
+    return pd.DataFrame({"area": df["ax"] * astep, "price": df["py"] * pstep, "n": df["n"]})
+
+
+# ── ANALYTICS FIGURES — built once per data version, shared by every viewer ──
+SEG_COLORS = {
+    "Affordable": "#00c896",
+    "Mid-Range":  "#1648ff",
+    "Premium":    "#ffb300",
+    "Luxury":     "#ff3d6b",
+}
+
+CHART_CONFIG = {"displayModeBar": False, "scrollZoom": False, "responsive": True}
+
+LAYOUT = dict(
+    paper_bgcolor="white",
+    font_family="Plus Jakarta Sans",
+    font=dict(color="#0d1f3c", size=12),
+    margin=dict(l=8, r=8, t=48, b=50),
+    height=340,
+    legend=dict(orientation="h", yanchor="bottom", y=-0.38,
+                xanchor="center", x=0.5,
+                font=dict(size=11, color="#0d1f3c")),
+    title_font=dict(size=14, color="#0d1f3c", family="Plus Jakarta Sans"),
+)
+
+
+def _apply_axis(fig, xgrid="#e8efff", ygrid="#e8efff", xtickangle=0):
+    """Apply consistent dark-label axis styling without dict-unpacking in kwargs."""
+    fig.update_xaxes(
+        color="#0d1f3c", tickcolor="#0d1f3c",
+        tickfont=dict(color="#0d1f3c", size=11, family="Plus Jakarta Sans"),
+        title_font=dict(color="#0d1f3c", size=12, family="Plus Jakarta Sans"),
+        linecolor="#dde3f5", automargin=True,
+        gridcolor=xgrid, tickangle=xtickangle,
+    )
+    fig.update_yaxes(
+        color="#0d1f3c", tickcolor="#0d1f3c",
+        tickfont=dict(color="#0d1f3c", size=11, family="Plus Jakarta Sans"),
+        title_font=dict(color="#0d1f3c", size=12, family="Plus Jakarta Sans"),
+        linecolor="#dde3f5", automargin=True,
+        gridcolor=ygrid,
+    )
+
+
+def _scatter_figure(version, mode):
+    if mode == "Density":
+        df = get_scatter_density(version)
+        fig = go.Figure(go.Heatmap(
+            x=df["area"], y=df["price"], z=df["n"], colorscale="Blues",
+            colorbar=dict(title="Valuations", thickness=12),
+            hovertemplate="≈%{x:,.0f} sq ft · ₹%{y:,.0f}<br>%{z:,} valuations<extra></extra>"))
+        fig.update_layout(title="📐 Area vs Predicted Price · density",
+                          xaxis_title="Area (sq ft)", yaxis_title="Price (₹)")
+    else:
+        df    = get_scatter_rows(version) if mode == "Points" else get_scatter_sample(version)
+        title = "📐 Area vs Predicted Price"
+        if mode != "Points":
+            title += f" · sample of {len(df):,}"
+        fig = px.scatter(df, x="area", y="predicted_price", color="segment",
+                         size="bedrooms", hover_data=["city","bedrooms","furnishing"],
+                         title=title,
+                         color_discrete_map=SEG_COLORS,
+                         labels={"predicted_price":"Price (₹)","area":"Area (sq ft)"},
+                         render_mode="webgl" if len(df) >= SCATTER_WEBGL_MIN else "svg")
+    fig.update_layout(plot_bgcolor="#fdf4ff", **LAYOUT)
+    _apply_axis(fig, xgrid="#f0e8ff", ygrid="#f0e8ff")
+    return fig
+
+
+# Sample and Density read the whole table, so they are keyed by resample_key().
+@st.cache_resource(max_entries=4, ttl=SCATTER_TTL, show_spinner=False)
+def get_scatter_figure(key, mode):
+    return _scatter_figure(key, mode)
+
+
+# cache_resource, not cache_data: the Figure objects are handed out as-is. Round-tripping them
+# through JSON costs more than building them, because st.plotly_chart re-validates dict input.
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_analytics_figures(version, scatter_mode="Points"):
+    # Chart 1 — State-wise bar (pre-aggregated state × segment)
+    df_state = analytics.state_segment_summary()
+    fig1 = px.bar(df_state, x="state", y="avg_price", color="segment",
+                  barmode="group", title=" State-wise Price Distribution",
+                  color_discrete_map=SEG_COLORS, hover_data={"n": True},
+                  labels={"avg_price":"Avg Price (₹)","state":"State","n":"Valuations"})
+    fig1.update_layout(plot_bgcolor="#f4f8ff", **LAYOUT)
+    _apply_axis(fig1, xgrid="#e8efff", ygrid="#e8efff", xtickangle=-40)
+
+    # Chart 2 — Area vs Price: every row ("Points"), a stratified sample, or an SQL density grid
+    if scatter_mode == "Points":
+        fig2 = _scatter_figure(version, scatter_mode)
+    else:
+        fig2 = get_scatter_figure(resample_key(version), scatter_mode)
+
+    # Chart 3 — Furnishing box/bar from SQL quartiles
+    df_furn = get_furnishing_quantiles(resample_key(version))
+    if len(df_furn) > 1:
+        fig3 = go.Figure([
+            go.Box(x=[r.furnishing], q1=[r.q1], median=[r.median], q3=[r.q3],
+                   lowerfence=[r.min], upperfence=[r.max], mean=[r.mean],
+                   name=r.furnishing, marker_color=c)
+            for r, c in zip(df_furn.itertuples(), ["#8b5cf6","#00d4ff","#ff3d6b"] * len(df_furn))
+        ])
+        fig3.update_layout(title="Price based on furniture",
+                           xaxis_title="Furnishing", yaxis_title="Price (₹)")
+    else:
+        fig3 = px.bar(df_furn, x="furnishing", y="mean", color="furnishing",
+                      title="Price based on furniture",
+                      color_discrete_sequence=["#8b5cf6"],
+                      labels={"mean":"Price (₹)","furnishing":"Furnishing"})
+    fig3.update_layout(plot_bgcolor="#fefce8", showlegend=False, **LAYOUT)
+    _apply_axis(fig3, xgrid="#fff3b0", ygrid="#fff3b0")
+
+    # Chart 4 — Segment count
+    seg_count = analytics.segment_counts()
+    fig4 = px.bar(seg_count, x="segment", y="count", color="segment",
+                  title="Valuations by Market Segment",
+                  color_discrete_map=SEG_COLORS,
+                  labels={"count":"Valuations","segment":"Segment"}, text="count")
+    fig4.update_layout(plot_bgcolor="#f0fff8", showlegend=False, **LAYOUT)
+    _apply_axis(fig4, xgrid="#c8f5e8", ygrid="#c8f5e8")
+    fig4.update_traces(textfont_color="#0d1f3c", textfont_size=12)
+
+    return {"state": fig1, "scatter": fig2, "furnishing": fig3, "segment": fig4}
+
+
+# ── MAP QUERIES — viewport-bounded, grid-clustered below MAP_CLUSTER_ZOOM ──
+MAP_MAX_MARKERS  = 300   # individual markers per render
+MAP_CLUSTER_ZOOM = 11    # below this zoom level points are grid-clustered in SQL
+MAP_CELL_PX      = 60    # cluster cell size in screen pixels
+MAP_GEO_FILTER   = "lat IS NOT NULL AND lon IS NOT NULL AND lat != 0 AND lon != 0"
+
+
+def _bbox_sql(bbox):
+    if not bbox:
+        return "", {}
+    s_, w_, n_, e_ = bbox
+    return " AND lat BETWEEN :s AND :n AND lon BETWEEN :w AND :e", {"s": s_, "w": w_, "n": n_, "e": e_}
+
+
+@st.cache_data(max_entries=2, ttl=SCATTER_TTL)
+def get_map_center(version):   # keyed by resample_key(): an average barely moves per valuation
+    df = _read_sql(f"SELECT AVG(lat) AS lat, AVG(lon) AS lon, COUNT(*) AS n FROM predictions WHERE {MAP_GEO_FILTER}")
+    if df.empty or not df.loc[0, "n"]:
+        return None
+    return float(df.loc[0, "lat"]), float(df.loc[0, "lon"])
+
+
+@st.cache_data(max_entries=64)
+def get_map_points(version, bbox, limit=MAP_MAX_MARKERS):
+    """Newest points inside bbox (s, w, n, e); one extra row flags truncation."""
+    where, params = _bbox_sql(bbox)
+    return _read_sql(f"""
+        SELECT p.id, lat, lon, city, state, username, area, bedrooms, bathrooms, stories,
+               furnishing, predicted_price, segment, m.thumb
+        FROM predictions p
+        LEFT JOIN media m ON m.id = (SELECT MIN(id) FROM media WHERE prediction_id = p.id
+                                     AND kind = 'photo' AND thumb IS NOT NULL)
+        WHERE {MAP_GEO_FILTER}{where}
+        ORDER BY p.id DESC LIMIT :lim""", {**params, "lim": limit + 1})
+
+
+@st.cache_data(max_entries=64)
+def get_map_clusters(version, bbox, zoom):
+    cell = 360.0 / (256 * 2 ** zoom) * MAP_CELL_PX   # degrees per cluster cell
+    where, params = _bbox_sql(bbox)
+    return _read_sql(f"""
+        SELECT COUNT(*) AS n, AVG(lat) AS lat, AVG(lon) AS lon,
+               AVG(predicted_price) AS avg_price
+        FROM predictions WHERE {MAP_GEO_FILTER}{where}
+        GROUP BY ROUND(lat / :cell), ROUND(lon / :cell)""", {**params, "cell": cell})
+
+
+def _view_from_folium(out):
+    """st_folium return -> (center, zoom, bbox) rounded so tiny jitters don't re-query."""
+    b = (out or {}).get("bounds") or {}
+    sw, ne = b.get("_southWest") or {}, b.get("_northEast") or {}
+    if sw.get("lat") is None or ne.get("lat") is None:
+        return None
+    c = out.get("center") or {}
+    bbox = tuple(round(v, 4) for v in (sw["lat"], sw["lng"], ne["lat"], ne["lng"]))
+    if c.get("lat") is None or c.get("lng") is None:
+        c = {"lat": (bbox[0] + bbox[2]) / 2, "lng": (bbox[1] + bbox[3]) / 2}
+    return {"center": (c["lat"], c["lng"]), "zoom": int(out.get("zoom") or 5), "bbox": bbox}
+
+
+def get_records_page(after=None, limit=PAGE_SIZE):
+    """Keyset page ordered newest first; `after` is the (timestamp, id) of the last row seen.
+    Fetches one extra row so the caller knows whether an older page exists."""
+    q, params = f"SELECT {RECORD_COLS} FROM predictions", {"n": limit + 1}
+    if after:
+        q += " WHERE timestamp < :ts OR (timestamp = :ts AND id < :id)"
+        params.update(ts=after[0], id=after[1])
+    return _read_sql(q + " ORDER BY timestamp DESC, id DESC LIMIT :n", params)
+
+
+analytics    = get_analytics_cache()
+
+
+IS_ADMIN = st.session_state.user in ADMIN_USERS
+# Section nav instead of st.tabs: st.tabs runs every body on every rerun, this runs only the
+# selected one. Each section is also a fragment, so its own widgets rerun just that section.
+TAB_NAMES  = [" Valuation", " Analytics", " Map"] + ([" Admin"] if IS_ADMIN else [])
+active_tab = st.radio("Section", TAB_NAMES, horizontal=True, key="active_tab", label_visibility="collapsed")
 
 # ════════════════════════════════════════════════════════════════
 #  TAB 1 — VALUATION
 # ════════════════════════════════════════════════════════════════
-with tab_val:
+@st.fragment
+def render_valuation():
 
     st.markdown('<div class="sec-head">📍 &nbsp; Property Location</div>', unsafe_allow_html=True)
 
@@ -931,19 +3401,31 @@ with tab_val:
     lc3, lc4 = st.columns(2)
     pincode = lc3.text_input("Pincode", placeholder="Enter Pincode")
 
+    # Local table / cache hits resolve inline; upstream lookups run on the background pool.
+    pin_res = None
     if pincode and len(pincode.strip()) >= 4 and pincode != st.session_state["_last_pin"]:
         cc = COUNTRY_CODES.get(country, "IN")
-        with st.spinner("Fetching city…"):
-            res = lookup_pincode(pincode.strip(), cc)
-        if res:
-            st.session_state.auto_city = res.get("city", "")
-            st.session_state.auto_lat  = res.get("lat",  0.0)
-            st.session_state.auto_lon  = res.get("lon",  0.0)
-            st.session_state["_last_pin"] = pincode
+        st.session_state["_last_pin"] = pincode
+        pin_res = lookup_pincodes([pincode], cc, network=False).get(pincode.strip())
+        if pin_res is None:
+            st.session_state["_pin_job"] = (pincode, background.submit(lookup_pincode, pincode.strip(), cc))
+    pin_job = st.session_state.get("_pin_job")
+    if pin_job and pin_job[0] != pincode:
+        st.session_state["_pin_job"] = pin_job = None
+    if pin_job and pin_job[1].done():
+        st.session_state["_pin_job"] = None
+        pin_res = pin_job[1].result()
+    if pin_res is not None:
+        if pin_res:
+            st.session_state.auto_city = pin_res.get("city", "")
+            st.session_state.auto_lat  = pin_res.get("lat",  0.0)
+            st.session_state.auto_lon  = pin_res.get("lon",  0.0)
             lc4.success(f"📍 **{st.session_state.auto_city}**")
         else:
             lc4.info("Not found please enter city")
-            st.session_state["_last_pin"] = pincode
+    elif pin_job:
+        lc4.info("Fetching city…")
+        _await_background(pin_job[1])
 
     city = lc4.text_input("🏙️ City", value=st.session_state.auto_city,
                           placeholder="Fetching from pincode")
@@ -1070,23 +3552,16 @@ with tab_val:
         elif area < 100:
             st.warning("enter a correct area.")
         else:
-            media_names = []
-            if photos:
-                for i, ph in enumerate(photos):
-                    fname = f"photo_{st.session_state.user}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{i}.jpg"
-                    with open(os.path.join("property_media", fname), "wb") as f:
-                        f.write(ph.getvalue())
-                    media_names.append(fname)
-            if video:
-                ext   = video.name.split(".")[-1]
-                fname = f"video_{st.session_state.user}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{ext}"
-                with open(os.path.join("property_media", fname), "wb") as f:
-                    f.write(video.getvalue())
-                media_names.append(fname)
-
+            uploads = [f for f in [*(photos or []), video] if f is not None]
+            for f in uploads:
+                if f.size > media_limit(f.name):
+                    st.warning(f"{f.name} is over {media_limit(f.name) >> 20} MB and was not saved.")
+            uploads = [f for f in uploads if f.size <= media_limit(f.name)]
+            media_job = None
+
+            geo_job, place = None, (city, state, country)
             if lat == 0.0 or lon == 0.0:
-                with st.spinner("view location of the propery"):
-                    lat, lon = geocode_address(city, state, country)
+                lat, lon = geocode_many([place], network=False).get(place, (0.0, 0.0))
 
             inputs = dict(
                 country=country, state=state, city=city, pincode=pincode,
@@ -1096,20 +3571,23 @@ with tab_val:
                 airconditioning=airconditioning, prefarea=prefarea, furnishing=furnishing,
             )
             with st.spinner("Predicting the Price"):
-                input_df   = build_input(inputs)
-                prediction = float(model.predict(input_df)[0])
+                prediction, _ = predict_one(inputs)
                 segment, emoji = price_segment(prediction)
                 low  = prediction * 0.90
                 high = prediction * 1.10
                 ppsf = prediction / area
-                save_prediction(st.session_state.user, inputs, prediction, segment, lat, lon,
-                                ",".join(media_names))
-                get_history.clear()
+                saved = save_prediction(st.session_state.user, inputs, prediction, segment, lat, lon,
+                                        model_version=MODEL_VERSION)
+                if lat == 0.0 and lon == 0.0:   # queued after the row, so the job's flush covers it
+                    geo_job = background.submit(backfill_locations, [place])
+                if uploads:
+                    media_job = ingest_media(st.session_state.user, uploads, saved)
                 st.session_state.result = {
                     "prediction": prediction, "segment": segment, "emoji": emoji,
                     "low": low, "high": high, "ppsf": ppsf, "area": area,
                     "bedrooms": bedrooms, "bathrooms": bathrooms,
-                    "city": city, "state": state, "lat": lat, "lon": lon,
+                    "city": city, "state": state, "country": country, "lat": lat, "lon": lon,
+                    "geo_job": geo_job, "media_job": media_job,
                 }
                 time.sleep(0.3)
             # Confetti
@@ -1137,13 +3615,55 @@ with tab_val:
 
     st.markdown("<div style='height:6px'></div>", unsafe_allow_html=True)
     if st.button("Logout", use_container_width=True, key="btn_logout_val"):
+        if SESSION_PARAM in st.query_params:
+            end_session(st.query_params[SESSION_PARAM])
+            del st.query_params[SESSION_PARAM]
         for k in defaults:
             st.session_state[k] = defaults[k]
         st.rerun()
 
+    # ── BULK IMPORT ──────────────────────────────────────────────
+    with st.expander("📦 Bulk Import (CSV / Parquet)"):
+        st.caption("Columns: " + ", ".join(BULK_REQUIRED) +
+                   " — optional: country, state, city, pincode, lat, lon and the "
+                   "yes/no amenities (" + ", ".join(AMENITY_FEATURES) + ").")
+        bulk_file = st.file_uploader("Listings file", type=["csv", "parquet", "pq"], key="bulk_upload")
+        if bulk_file and st.button("Import & Predict", use_container_width=True, key="btn_bulk"):
+            if model is None:
+                st.error(" files not found. Place `house_model.pkl` and `model_columns.pkl` in the project folder.")
+            else:
+                bar = st.progress(0, text="Scoring…")
+
+                def _progress(frac, done, secs):
+                    bar.progress(min(int(frac * 100), 100),
+                                 text=f"{done:,} rows · {done / max(secs, 1e-9):,.0f} rows/s")
+                try:
+                    n_rows, secs = bulk_import(bulk_file, st.session_state.user, on_progress=_progress)
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                else:
+                    bar.progress(100, text="Done")
+                    analytics.refresh()
+                    st.success(f"Imported **{n_rows:,}** properties in {secs:,.1f}s "
+                               f"({n_rows / max(secs, 1e-9):,.0f} rows/s).")
+
     # ── RESULT CARD ──────────────────────────────────────────────
     if st.session_state.result:
         r          = st.session_state.result
+        geo_job    = r.get("geo_job")
+        if geo_job is not None and geo_job.done():
+            r["geo_job"] = None
+            try:
+                r["lat"], r["lon"] = geo_job.result().get((r["city"], r["state"], r["country"]), (0.0, 0.0))
+            except Exception:
+                pass
+        media_job  = r.get("media_job")
+        if media_job is not None and media_job.done():
+            r["media_job"] = None
+            try:
+                r["media_rejected"] = media_job.result()[1]
+            except Exception as e:
+                r["media_rejected"] = [("Media", str(e))]
         prediction = r["prediction"]
         segment    = r["segment"]
         emoji      = r["emoji"]
@@ -1218,6 +3738,14 @@ with tab_val:
         sl3.caption("🟡 High-Range ₹80L–2Cr")
         sl4.caption("💎 Top-Range > ₹2Cr")
 
+        if r.get("geo_job") is not None:
+            st.caption("📍 Locating the property — the map appears once the address resolves.")
+            _await_background(r["geo_job"])
+        if r.get("media_job") is not None:
+            st.caption("📎 Saving your photos and video in the background…")
+            _await_background(r["media_job"])
+        for fname, why in r.get("media_rejected", []):
+            st.warning(f"{fname} was not saved: {why}")
         if lat != 0.0 and lon != 0.0:
             st.markdown('<div class="sec-head">📍 &nbsp;Property Location on Map</div>',
                         unsafe_allow_html=True)
@@ -1234,12 +3762,15 @@ with tab_val:
             ).add_to(rmap)
             folium.Circle(location=[lat, lon], radius=600,
                           color="#1648ff", fill=True, fill_opacity=0.07).add_to(rmap)
-            st_folium(rmap, use_container_width=True, height=320, key="result_map")
+            streamlit_folium.st_folium(rmap, use_container_width=True, height=320, key="result_map")
 
 # ════════════════════════════════════════════════════════════════
 #  TAB 2 — ANALYTICS
 # ════════════════════════════════════════════════════════════════
-with tab_analytics:
+@st.fragment
+def render_analytics():
+    prediction_writer.flush(READ_FLUSH_SECS)   # read-your-writes, but never stall the page on a slow DB
+    data_version = analytics.refresh()   # bumped on every change; keys every row-level cache below
 
     # Vibrant analytics header
     st.markdown("""
@@ -1256,7 +3787,8 @@ with tab_analytics:
     </div>
     """, unsafe_allow_html=True)
 
-    if df_hist.empty:
+    kpi = analytics.kpis()
+    if not kpi["n"]:
         st.markdown("""
         <div style='background:linear-gradient(135deg,#f0f5ff,#e8efff);
              border-radius:16px;padding:32px 24px;text-align:center;
@@ -1282,109 +3814,50 @@ with tab_analytics:
         """, unsafe_allow_html=True)
 
         k1, k2 = st.columns(2)
-        k1.metric("Total Valuations",  f"{len(df_hist):,}")
-        k2.metric("Price",          f"₹{df_hist['predicted_price'].mean():,.0f}")
+        k1.metric("Total Valuations",  f"{int(kpi['n']):,}")
+        k2.metric("Price",          f"₹{kpi['avg_price'] or 0:,.0f}")
         k3, k4 = st.columns(2)
-        k3.metric("Total Area",           f"{df_hist['area'].mean():,.0f} sq ft")
-        k4.metric("Price Per Square Foot",        f"₹{df_hist['price_per_sqft'].mean():,.0f}")
+        k3.metric("Total Area",           f"{kpi['avg_area'] or 0:,.0f} sq ft")
+        k4.metric("Price Per Square Foot",        f"₹{kpi['avg_ppsf'] or 0:,.0f}")
 
         st.markdown("<div style='height:8px'></div>", unsafe_allow_html=True)
 
-        SEG_COLORS = {
-            "Affordable": "#00c896",
-            "Mid-Range":  "#1648ff",
-            "Premium":    "#ffb300",
-            "Luxury":     "#ff3d6b",
-        }
-
-        CHART_CONFIG = {"displayModeBar": False, "scrollZoom": False, "responsive": True}
-
-        LAYOUT = dict(
-            paper_bgcolor="white",
-            font_family="Plus Jakarta Sans",
-            font=dict(color="#0d1f3c", size=12),
-            margin=dict(l=8, r=8, t=48, b=50),
-            height=340,
-            legend=dict(orientation="h", yanchor="bottom", y=-0.38,
-                        xanchor="center", x=0.5,
-                        font=dict(size=11, color="#0d1f3c")),
-            title_font=dict(size=14, color="#0d1f3c", family="Plus Jakarta Sans"),
-        )
-
-        def _apply_axis(fig, xgrid="#e8efff", ygrid="#e8efff", xtickangle=0):
-            """Apply consistent dark-label axis styling without dict-unpacking in kwargs."""
-            fig.update_xaxes(
-                color="#0d1f3c", tickcolor="#0d1f3c",
-                tickfont=dict(color="#0d1f3c", size=11, family="Plus Jakarta Sans"),
-                title_font=dict(color="#0d1f3c", size=12, family="Plus Jakarta Sans"),
-                linecolor="#dde3f5", automargin=True,
-                gridcolor=xgrid, tickangle=xtickangle,
-            )
-            fig.update_yaxes(
-                color="#0d1f3c", tickcolor="#0d1f3c",
-                tickfont=dict(color="#0d1f3c", size=11, family="Plus Jakarta Sans"),
-                title_font=dict(color="#0d1f3c", size=12, family="Plus Jakarta Sans"),
-                linecolor="#dde3f5", automargin=True,
-                gridcolor=ygrid,
-            )
-
-        # Chart 1 — State-wise bar
-        fig1 = px.bar(df_hist, x="state", y="predicted_price", color="segment",
-                      barmode="group", title=" State-wise Price Distribution",
-                      color_discrete_map=SEG_COLORS,
-                      labels={"predicted_price":"Price (₹)","state":"State"})
-        fig1.update_layout(plot_bgcolor="#f4f8ff", **LAYOUT)
-        _apply_axis(fig1, xgrid="#e8efff", ygrid="#e8efff", xtickangle=-40)
-        st.plotly_chart(fig1, use_container_width=True, config=CHART_CONFIG)
-
-        # Chart 2 — Area vs Price scatter
-        fig2 = px.scatter(df_hist, x="area", y="predicted_price", color="segment",
-                          size="bedrooms", hover_data=["city","bedrooms","furnishing"],
-                          title="📐 Area vs Predicted Price",
-                          color_discrete_map=SEG_COLORS,
-                          labels={"predicted_price":"Price (₹)","area":"Area (sq ft)"})
-        fig2.update_layout(plot_bgcolor="#fdf4ff", **LAYOUT)
-        _apply_axis(fig2, xgrid="#f0e8ff", ygrid="#f0e8ff")
-        st.plotly_chart(fig2, use_container_width=True, config=CHART_CONFIG)
-
-        # Chart 3 — Furnishing box/bar
-        if df_hist["furnishing"].nunique() > 1:
-            fig3 = px.box(df_hist, x="furnishing", y="predicted_price", color="furnishing",
-                          title="Price based on furniture",
-                          color_discrete_sequence=["#8b5cf6","#00d4ff","#ff3d6b"],
-                          labels={"predicted_price":"Price (₹)","furnishing":"Furnishing"})
-        else:
-            fig3 = px.bar(df_hist, x="furnishing", y="predicted_price", color="furnishing",
-                          title="Price based on furniture",
-                          color_discrete_sequence=["#8b5cf6"],
-                          labels={"predicted_price":"Price (₹)","furnishing":"Furnishing"})
-        fig3.update_layout(plot_bgcolor="#fefce8", showlegend=False, **LAYOUT)
-        _apply_axis(fig3, xgrid="#fff3b0", ygrid="#fff3b0")
-        st.plotly_chart(fig3, use_container_width=True, config=CHART_CONFIG)
-
-        # Chart 4 — Segment count
-        seg_count = df_hist.groupby("segment")["predicted_price"].count().reset_index()
-        seg_count.columns = ["segment","count"]
-        fig4 = px.bar(seg_count, x="segment", y="count", color="segment",
-                      title="Valuations by Market Segment",
-                      color_discrete_map=SEG_COLORS,
-                      labels={"count":"Valuations","segment":"Segment"}, text="count")
-        fig4.update_layout(plot_bgcolor="#f0fff8", showlegend=False, **LAYOUT)
-        _apply_axis(fig4, xgrid="#c8f5e8", ygrid="#c8f5e8")
-        fig4.update_traces(textfont_color="#0d1f3c", textfont_size=12)
-        st.plotly_chart(fig4, use_container_width=True, config=CHART_CONFIG)
+        # Past the point budget the scatter is never sent row-for-row: sample or density grid.
+        scatter_mode = "Points"
+        if kpi["n"] > SCATTER_MAX_POINTS:
+            scatter_mode = st.radio("Area vs Price view", ["Sample", "Density"], horizontal=True,
+                                    key="scatter_mode",
+                                    help=f"{kpi['n']:,} valuations exceed the {SCATTER_MAX_POINTS:,}-point budget.")
+        figs = get_analytics_figures(data_version, scatter_mode)
+        for fig in figs.values():
+            st.plotly_chart(fig, use_container_width=True, config=CHART_CONFIG)
 
         with st.expander("All reords"):
-            show_cols = ["timestamp","city","state","area","bedrooms",
-                         "bathrooms","furnishing","predicted_price","segment"]
-            avail = [c for c in show_cols if c in df_hist.columns]
-            st.dataframe(df_hist[avail].rename(columns={"predicted_price":"Price (₹)"}),
+            cursors = st.session_state.rec_cursors
+            page    = get_records_page(cursors[-1])
+            older   = len(page) > PAGE_SIZE
+            page    = page.head(PAGE_SIZE)
+            st.dataframe(page.drop(columns="id").rename(columns={"predicted_price":"Price (₹)"}),
                          use_container_width=True, hide_index=True)
+            st.caption(f"Page {len(cursors)} · {len(page)} rows")
+            pg_prev, pg_next = st.columns(2)
+            if pg_prev.button("◀ Newer", use_container_width=True, key="rec_prev",
+                              disabled=len(cursors) == 1):
+                st.session_state.rec_cursors = cursors[:-1]
+                st.rerun()
+            if pg_next.button("Older ▶", use_container_width=True, key="rec_next",
+                              disabled=not older):
+                last = page.iloc[-1]
+                st.session_state.rec_cursors = cursors + ((last["timestamp"], int(last["id"])),)
+                st.rerun()
 
 # ════════════════════════════════════════════════════════════════
 #  TAB 3 — MAP EXPLORER
 # ════════════════════════════════════════════════════════════════
-with tab_map:
+@st.fragment
+def render_map():
+    prediction_writer.flush(READ_FLUSH_SECS)
+    data_version = analytics.refresh()
 
     st.markdown("""
     <div style='background:linear-gradient(135deg,#00874a,#00c896);
@@ -1400,35 +3873,49 @@ with tab_map:
     </div>
     """, unsafe_allow_html=True)
 
-    df_map = pd.DataFrame()
-    if not df_hist.empty:
-        df_map = df_hist[
-            df_hist["lat"].notna() & df_hist["lon"].notna() &
-            (df_hist["lat"] != 0)  & (df_hist["lon"] != 0)
-        ].copy()
+    view   = st.session_state.map_view
+    map_version = (data_version, background.geo_revision)   # backfilled coordinates count as new data
+    center = get_map_center((resample_key(data_version), background.geo_revision))
+    if view is None:
+        view = {"center": center or (20.5, 78.9), "zoom": 6 if center else 5, "bbox": None}
 
-    if df_map.empty:
+    SEG_COLOR = {"Affordable":"green","Mid-Range":"blue","Premium":"orange","Luxury":"red"}
+    SEG_EMOJI = {"Low-Range":"🟢","Mid-Range":"🔵","High-Range":"🟠","Top-Range":"🔴"}
+    m = folium.Map(location=list(view["center"]), zoom_start=view["zoom"], tiles="CartoDB positron")
+
+    if center is None:
         st.info("Properties will appear here after valuations with location data.")
-        m = folium.Map(location=[20.5, 78.9], zoom_start=5, tiles="CartoDB positron")
+    elif view["zoom"] < MAP_CLUSTER_ZOOM:
+        clusters = get_map_clusters(map_version, view["bbox"], view["zoom"])
+        st.caption(f"{int(clusters['n'].sum()) if not clusters.empty else 0:,} properties in view · "
+                   f"zoom in to see individual pins")
+        for row in clusters.itertuples():
+            size   = 26 + min(int(np.log10(row.n) * 12), 30)
+            folium.Marker(
+                location=[row.lat, row.lon],
+                popup=folium.Popup(f"<b>{row.n:,} properties</b><br>Avg ₹{row.avg_price:,.0f}",
+                                   max_width=200),
+                icon=folium.DivIcon(
+                    icon_size=(size, size), icon_anchor=(size // 2, size // 2),
+                    html=(f"<div style='width:{size}px;height:{size}px;border-radius:50%;"
+                          f"background:#1648ff;color:white;font:700 12px Arial;opacity:0.85;"
+                          f"display:flex;align-items:center;justify-content:center;"
+                          f"box-shadow:0 2px 8px rgba(0,0,0,0.3);'>{row.n:,}</div>")),
+            ).add_to(m)
     else:
-        m = folium.Map(location=[df_map["lat"].mean(), df_map["lon"].mean()],
-                       zoom_start=6, tiles="CartoDB positron")
-        SEG_COLOR = {"Affordable":"green","Mid-Range":"blue","Premium":"orange","Luxury":"red"}
-        SEG_EMOJI = {"Low-Range":"🟢","Mid-Range":"🔵","High-Range":"🟠","Top-Range":"🔴"}
+        df_map = get_map_points(map_version, view["bbox"])
+        if len(df_map) > MAP_MAX_MARKERS:
+            st.caption(f"Showing the {MAP_MAX_MARKERS} newest properties in view — zoom in for more.")
+            df_map = df_map.head(MAP_MAX_MARKERS)
 
         for _, row in df_map.iterrows():
             color = SEG_COLOR.get(row["segment"], "blue")
             emoji = SEG_EMOJI.get(row["segment"], "🏠")
             media_html = ""
-            if row.get("media_paths"):
-                paths = [p.strip() for p in str(row["media_paths"]).split(",") if p.strip()]
-                for p in paths[:1]:
-                    fp = os.path.join("property_media", p)
-                    if os.path.exists(fp) and p.lower().endswith((".jpg",".jpeg",".png")):
-                        with open(fp, "rb") as f:
-                            b64 = base64.b64encode(f.read()).decode()
-                        media_html = (f'<br><img src="data:image/jpeg;base64,{b64}" '
-                                      f'width="160" style="border-radius:6px;margin-top:6px;"/>')
+            thumb = row["thumb"]
+            if isinstance(thumb, str) and thumb:
+                media_html = (f'<br><img src="{THUMB_URL}/{thumb}" loading="lazy" '
+                              f'width="160" style="border-radius:6px;margin-top:6px;"/>')
             folium.Marker(
                 location=[row["lat"], row["lon"]],
                 popup=folium.Popup(
@@ -1444,6 +3931,7 @@ with tab_map:
                 icon=folium.Icon(color=color, icon="home", prefix="fa")
             ).add_to(m)
 
+    if center is not None:
         m.get_root().html.add_child(folium.Element("""
         <div style="
             position:fixed;
@@ -1472,7 +3960,112 @@ with tab_map:
         </div>
         """))
 
-    st_folium(m, use_container_width=True, height=500, key="explorer_map")
+    out = streamlit_folium.st_folium(m, center=list(view["center"]), zoom=view["zoom"],
+                    use_container_width=True, height=500, key="explorer_map",
+                    returned_objects=["bounds", "zoom", "center"])
+    new_view = _view_from_folium(out)
+    if new_view and (new_view["bbox"], new_view["zoom"]) != (view["bbox"], view["zoom"]):
+        st.session_state.map_view = new_view
+        st.rerun()
+
+# ════════════════════════════════════════════════════════════════
+#  TAB 4 — ADMIN
+# ════════════════════════════════════════════════════════════════
+@st.fragment
+def render_admin():
+    st.markdown('<div class="sec-head">⚡ &nbsp;Batch Valuation Benchmark</div>', unsafe_allow_html=True)
+    if model is None:
+        st.info("Model files not found — benchmark needs `house_model.pkl`.")
+    else:
+        bn1, bn2 = st.columns(2)
+        bench_n    = bn1.number_input("Batch rows", 1_000, 1_000_000, 10_000, step=1_000)
+        bench_loop = bn2.number_input("Per-row loop sample", 50, 5_000, 500, step=50)
+        if st.button("Run benchmark", use_container_width=True, key="btn_bench_batch"):
+            with st.spinner("Benchmarking…"):
+                b = benchmark_batch(int(bench_n), int(bench_loop))
+            b1, b2 = st.columns(2)
+            b1.metric("Per-row loop", f"{b['loop_rows_per_s']:,.0f} rows/s")
+            b2.metric("Batch",        f"{b['batch_rows_per_s']:,.0f} rows/s",
+                      delta=f"{b['speedup']:,.1f}× faster")
+
+    st.markdown('<div class="sec-head">📦 &nbsp;Model Registry</div>', unsafe_allow_html=True)
+    mr1, mr2 = st.columns(2)
+    mr1.metric("Serving", MODEL_VERSION or "—")
+    mr2.metric("Loaded",  model_registry.loaded_at.strftime("%H:%M:%S") if model_registry.loaded_at else "—")
+    st.caption(f"Registry `{model_registry.root}` · latest on disk: "
+               f"{model_registry.latest_version() or 'none (legacy files)'} · polls every {model_registry.poll_secs:g}s")
+    if model_registry.last_error:
+        st.warning(f"Last load failed — {model_registry.last_error}")
+    if st.button("Check for a new model now", use_container_width=True, key="btn_model_check"):
+        with st.spinner("Loading and warming…"):
+            swapped = model_registry.check()
+        st.success("Swapped to the new version." if swapped else "Already serving the latest version.")
+
+    st.markdown('<div class="sec-head">🗄️ &nbsp;Storage</div>', unsafe_allow_html=True)
+    st.caption(f"Backend `{engine.dialect.name}` · pool: {engine.pool.status()}")
+    st.caption("Write-behind queue: " + " · ".join(f"{k} {v:,.4g}" for k, v in prediction_writer.stats().items())
+               + f" · batches of ≤{prediction_writer.batch_rows} rows / {prediction_writer.batch_ms} ms"
+               + (f" · journal `{prediction_writer.journal}`" if prediction_writer.journal else ""))
+    lt1, lt2 = st.columns(2)
+    lt_users = lt1.number_input("Concurrent users", 2, 64, 8)
+    lt_ops   = lt2.number_input("Operations per user", 20, 2_000, 200, step=20)
+    if st.button("Run load test", use_container_width=True, key="btn_load_test"):
+        with st.spinner("Load testing…"):
+            lt = pd.DataFrame([load_test(1, int(lt_ops)), load_test(int(lt_users), int(lt_ops)),
+                               load_test(int(lt_users), int(lt_ops), write_behind=True)])
+        st.dataframe(lt, use_container_width=True, hide_index=True,
+                     column_config={c: st.column_config.NumberColumn(format="%.1f")
+                                    for c in ("ops_per_s", "p50_ms", "p95_ms")})
+        st.caption("20% writes into a scratch table, 80% newest-page reads. "
+                   "Row 1 is a single session baseline; the last row queues writes like save_prediction.")
+
+    st.markdown('<div class="sec-head">🔐 &nbsp;Password Hashing</div>', unsafe_allow_html=True)
+    pb1, pb2 = st.columns(2)
+    pw_n    = pb1.number_input("Logins", 8, 1_000, 64, step=8)
+    pw_conc = pb2.number_input("Concurrent sessions", 1, 64, 8)
+    if st.button("Benchmark login throughput", use_container_width=True, key="btn_bench_login"):
+        with st.spinner("Hashing…"):
+            lb = benchmark_login(int(pw_n), int(pw_conc))
+        lb1, lb2 = st.columns(2)
+        lb1.metric("Logins / s", f"{lb['logins_per_s']:,.1f}", delta=f"{lb['workers']} KDF workers")
+        lb2.metric("p95 latency", f"{lb['p95_ms']:,.0f} ms", delta=f"p50 {lb['p50_ms']:,.0f} ms", delta_color="off")
+        st.caption(f"scrypt {lb['cost']}")
+    st.caption("Login limiter: " + " · ".join(f"{k} {v:,}" for k, v in login_limiter.stats().items())
+               + f" · {'shared table' if login_limiter.shared else 'in-process'}")
+
+    st.markdown('<div class="sec-head">🧠 &nbsp;Prediction Cache</div>', unsafe_allow_html=True)
+    pc = prediction_cache.stats()
+    pc1, pc2 = st.columns(2)
+    pc1.metric("Hit rate", f"{pc['hit_rate']:.0%}", delta=f"{pc['hits']:,} hits · {pc['misses']:,} misses")
+    pc2.metric("Entries",  f"{pc['size']:,}",       delta=f"{pc['evictions']:,} evictions")
+    st.caption(f"Model version {MODEL_VERSION or '—'} · shared hits {pc['shared_hits']:,} · "
+               f"shared table {'on' if prediction_cache.shared else 'off'}")
+    if st.button("Clear prediction cache", use_container_width=True, key="btn_clear_pcache"):
+        prediction_cache.clear()
+        st.rerun()
+
+    st.markdown('<div class="sec-head">🌐 &nbsp;External Geocoders</div>', unsafe_allow_html=True)
+    http_stats = http_client.stats()
+    if http_stats.empty:
+        st.caption("No upstream calls yet.")
+    else:
+        st.dataframe(http_stats, use_container_width=True, hide_index=True)
+    st.caption("Geocode LRU: " + " · ".join(f"{k} {v:,}" for k, v in geo_cache.lru.stats().items()))
+
+    st.markdown('<div class="sec-head">⏱️ &nbsp;Cold Start</div>', unsafe_allow_html=True)
+    startup = pd.DataFrame(
+        [("phase", k, v * 1000) for k, v in STARTUP["phases"].items()]
+        + [("lazy import", k, v * 1000) for k, v in STARTUP["imports"].items()],
+        columns=["kind", "name", "ms"])
+    st.dataframe(startup.sort_values("ms", ascending=False), use_container_width=True, hide_index=True,
+                 column_config={"ms": st.column_config.NumberColumn(format="%.1f")})
+    st.caption("First-run timings for this process. For a per-module breakdown of the eager imports "
+               "run `python -X importtime -c \"import streamlit, sqlalchemy, numpy\"`.")
+
+
+# ── ACTIVE SECTION ───────────────────────────────────────────────
+{" Valuation": render_valuation, " Analytics": render_analytics,
+ " Map": render_map, " Admin": render_admin}[active_tab]()
 
 # ── FOOTER ───────────────────────────────────────────────────────
 st.markdown("""
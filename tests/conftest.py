@@ -0,0 +1,93 @@
+"""The app is a single Streamlit script, so tests execute it once in bare mode (no
+server: widgets return their defaults, st.stop() is a no-op) inside a scratch
+directory and work with the resulting module namespace."""
+import json
+import os
+import runpy
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import streamlit as st
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(workdir, monkeypatch, **env):
+    """Run proproperty_ai.py in `workdir` with `env` overrides; returns its globals."""
+    for name in ("data", "model_columns.pkl", "house_model.pkl"):
+        src = os.path.join(ROOT, name)
+        if os.path.isdir(src):
+            shutil.copytree(src, os.path.join(workdir, name))
+        elif os.path.exists(src):
+            shutil.copy(src, workdir)
+    monkeypatch.chdir(workdir)
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    # Hermetic: never adopt a developer's real /tmp/proproperty.db into the test database.
+    monkeypatch.setenv("LEGACY_DB_PATH", os.path.join(workdir, "legacy", "proproperty.db"))
+    for key, value in env.items():
+        monkeypatch.setenv(key, str(value))
+    st.cache_resource.clear()   # every load gets its own engine, writer, caches …
+    st.cache_data.clear()
+    app = runpy.run_path(os.path.join(ROOT, "proproperty_ai.py"), run_name="proproperty_ai")
+    yield app
+    app["prediction_writer"].close()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The app on a fresh SQLite database."""
+    yield from load_app(tmp_path, monkeypatch)
+
+
+@pytest.fixture
+def pg_app(tmp_path, monkeypatch):
+    """The app on TEST_DATABASE_URL; skipped unless that is a PostgreSQL URL."""
+    url = os.getenv("TEST_DATABASE_URL", "")
+    if not url.startswith(("postgres://", "postgresql")):
+        pytest.skip("TEST_DATABASE_URL is not a PostgreSQL URL")
+    yield from load_app(tmp_path, monkeypatch, DATABASE_URL=url)
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def any_app(request):
+    """The test once per backend (the PostgreSQL run is skipped as for pg_app)."""
+    return request.getfixturevalue("app" if request.param == "sqlite" else "pg_app")
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        status, body, headers, delay = self.server.respond(self.path)
+        time.sleep(delay)
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            for key, value in {"Content-Type": "application/json", **headers}.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:   # the client timed out and hung up
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    """A local HTTP server standing in for an upstream API. Tests set
+    `server.respond = lambda path: (status, json_body, headers, delay)`; every request
+    path is appended to `server.hits` and the base URL is `server.url`."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    server.hits    = []
+    server.respond = lambda path: (200, {}, {}, 0)
+    server.url     = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
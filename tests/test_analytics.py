@@ -0,0 +1,101 @@
+"""Dashboard aggregates and the Area vs Price figure on large tables."""
+import pytest
+from sqlalchemy import text
+
+
+def _insert(app, n, start=0):
+    rows = [{"u": "analytics-test", "s": "Kerala", "seg": "Mid-Range",
+             "a": 500.0 + i, "p": 1_000_000.0 + 100 * i, "pp": 2_000.0} for i in range(start, start + n)]
+    with app["engine"].begin() as con:
+        con.execute(text("INSERT INTO predictions (username, state, segment, area, predicted_price, "
+                         "price_per_sqft) VALUES (:u, :s, :seg, :a, :p, :pp)"), rows)
+
+
+def test_density_on_empty_table(app):
+    assert app["get_scatter_density"](0).empty
+
+
+def test_density_survives_failed_query(app, monkeypatch):
+    monkeypatch.setitem(app["get_scatter_density"].__globals__, "_read_sql",
+                        lambda *a, **k: app["pd"].DataFrame())
+    assert app["get_scatter_density"](0).empty
+
+
+def test_density_counts_every_row(app):
+    _insert(app, 250)
+    assert app["get_scatter_density"](0, bins=10)["n"].sum() == 250
+
+
+def test_sample_and_density_skip_single_valuations(app):
+    g = app["_scatter_figure"].__globals__
+    g["SCATTER_RESAMPLE_ROWS"] = 100
+    _insert(app, 150)
+    figs = g["get_analytics_figures"](g["analytics"].refresh(), "Density")
+    _insert(app, 10, start=150)   # same bucket: the density grid is reused
+    again = g["get_analytics_figures"](g["analytics"].refresh(), "Density")
+    assert again["scatter"] is figs["scatter"]
+    _insert(app, 50, start=160)   # next bucket: re-read
+    fresh = g["get_analytics_figures"](g["analytics"].refresh(), "Density")
+    assert fresh["scatter"] is not figs["scatter"]
+    assert sum(fresh["scatter"].data[0].z) == pytest.approx(210)
+
+
+def _insert_id(app, id_, price):
+    with app["engine"].begin() as con:
+        con.execute(text("INSERT INTO predictions (id, username, state, segment, area, predicted_price, "
+                         "price_per_sqft) VALUES (:id, 'analytics-test', 'Goa', 'Premium', 1000, :p, 0)"),
+                    {"id": id_, "p": price})
+
+
+def test_late_commit_below_high_water_is_counted(app):
+    cache = app["AnalyticsCache"]()
+    _insert_id(app, 10, 1.0)
+    _insert_id(app, 12, 2.0)
+    v = cache.refresh()
+    _insert_id(app, 11, 4.0)   # a slower writer commits an older id
+    assert cache.refresh() != v
+    assert cache.kpis()["n"] == 3 and cache.sum_price == 7.0
+    assert cache.refresh() == cache.refresh()   # nothing new, nothing double-counted
+    assert cache.kpis()["n"] == 3
+
+
+def test_recompute_catches_rows_outside_the_window(app):
+    g = app["AnalyticsCache"].__init__.__globals__
+    g["ANALYTICS_LAG_IDS"] = 1
+    cache = app["AnalyticsCache"]()
+    _insert_id(app, 10, 1.0)
+    _insert_id(app, 20, 2.0)
+    cache.refresh()
+    _insert_id(app, 15, 4.0)   # older than the open window: missed until the rebuild
+    cache.refresh()
+    assert cache.kpis()["n"] == 2
+    g["ANALYTICS_RECOMPUTE_SECS"] = 0
+    cache.refresh()
+    assert cache.kpis()["n"] == 3 and cache.sum_price == 7.0
+
+
+def test_whole_table_reads_skip_single_valuations(app, monkeypatch):
+    g = app["_scatter_figure"].__globals__
+    g["SCATTER_RESAMPLE_ROWS"] = 100
+    reads, real = [], g["_read_sql"]
+
+    def counting(q, *a, **k):
+        reads.append(q)
+        return real(q, *a, **k)
+    monkeypatch.setitem(g, "_read_sql", counting)
+
+    def scans():
+        version = g["analytics"].refresh()
+        g["get_analytics_figures"](version, "Density")
+        g["get_map_center"]((g["resample_key"](version), 0))
+        return sum("ROW_NUMBER" in q or "AVG(lat)" in q for q in reads)
+    _insert(app, 50)
+    first = scans()
+    _insert(app, 1, start=50)   # small table: every valuation still shows up at once
+    assert scans() == first + 2
+    _insert(app, 100, start=51)
+    bucketed = scans()
+    _insert(app, 10, start=151)   # same bucket: quartiles and map centre are reused
+    assert scans() == bucketed
+    _insert(app, 50, start=161)   # next bucket: re-read
+    assert scans() == bucketed + 2
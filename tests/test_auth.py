@@ -0,0 +1,141 @@
+"""Password hashing and sign-in: legacy digests are upgraded on login, malformed hashes
+never verify, and a saturated KDF pool refuses work instead of queueing it. Registration
+races and session tokens: a rotated, expired or logged-out sid no longer resumes."""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+
+def _add_user(app, user, stored):
+    with app["engine"].begin() as con:
+        con.execute(text("INSERT INTO users VALUES (:u, :p, 'test')"), {"u": user, "p": stored})
+
+
+def _stored(app, user):
+    with app["engine"].connect() as con:
+        return con.execute(text("SELECT password FROM users WHERE username=:u"), {"u": user}).scalar()
+
+
+def _saturated(app):
+    """A one-slot hasher whose slot is held until the returned event is set."""
+    hasher, release, held = app["PasswordHasher"](workers=1, max_pending=1), threading.Event(), threading.Event()
+
+    def hold():
+        held.set()
+        release.wait(10)
+    threading.Thread(target=hasher._run, args=(hold,), daemon=True).start()
+    assert held.wait(5)
+    return hasher, release
+
+
+def test_legacy_digest_is_accepted_and_upgraded(app):
+    _add_user(app, "legacy", hashlib.sha256(b"hunter22").hexdigest())
+    assert app["login_user"]("legacy", "hunter22") == (True, "ok")
+    upgraded = _stored(app, "legacy")
+    assert upgraded.startswith("scrypt$") and app["_verify_sync"]("hunter22", upgraded) == (True, False)
+    assert app["login_user"]("legacy", "hunter22") == (True, "ok")
+    assert _stored(app, "legacy") == upgraded   # current cost: no further rehash
+
+
+@pytest.mark.parametrize("stored", ["scrypt$", "scrypt$16384$8$1$!!$??", "scrypt$3$8$1$c2FsdA==$ZGlnZXN0",
+                                    "scrypt$16384$8$1$c2FsdA==", "", "$2b$12$" + "x" * 53])
+def test_malformed_hash_is_rejected_without_raising(app, stored):
+    assert app["_verify_sync"]("hunter22", stored) == (False, False)
+    _add_user(app, "broken", stored)
+    assert app["login_user"]("broken", "hunter22") == (False, "Incorrect password.")
+
+
+def test_saturated_pool_refuses_instead_of_queueing(app, monkeypatch):
+    hasher, release = _saturated(app)
+    try:
+        with pytest.raises(app["PasswordBusy"]):
+            hasher.hash("hunter22")
+        _add_user(app, "busy", app["_hash_sync"]("hunter22"))
+        monkeypatch.setitem(app["login_user"].__globals__, "password_hasher", hasher)
+        ok, msg = app["login_user"]("busy", "hunter22")
+        assert not ok and "try again" in msg
+    finally:
+        release.set()
+
+
+def test_failed_rehash_still_signs_in(app, monkeypatch):
+    legacy = hashlib.sha256(b"hunter22").hexdigest()
+    _add_user(app, "legacy", legacy)
+
+    def busy(pw):
+        raise app["PasswordBusy"]("busy")
+    monkeypatch.setitem(app["login_user"].__globals__, "hash_pw", busy)
+    assert app["login_user"]("legacy", "hunter22") == (True, "ok")
+    assert _stored(app, "legacy") == legacy   # upgraded on a later login instead
+
+    monkeypatch.setitem(app["login_user"].__globals__, "hash_pw", app["hash_pw"])
+    monkeypatch.setitem(app["login_user"].__globals__, "engine", _WritesFail(app["engine"]))
+    assert app["login_user"]("legacy", "hunter22") == (True, "ok")
+    assert _stored(app, "legacy") == legacy
+
+
+class _WritesFail:
+    """Reads go to the real engine; every write transaction fails."""
+
+    def __init__(self, engine):
+        self.connect = engine.connect
+
+    def begin(self):
+        raise OperationalError("UPDATE", {}, Exception("database is locked"))
+
+
+def test_registration_racing_the_negative_cache(app):
+    assert not app["user_exists"]("carol")   # cached as available for USER_NEG_TTL
+    _add_user(app, "carol", app["_hash_sync"]("elsewhere"))   # another worker registers it
+    assert not app["user_exists"]("carol")   # still stale …
+    assert app["register_user"]("carol", "hunter22") == (False, "Username already taken.")
+    assert app["user_exists"]("carol")       # … until the primary key said otherwise
+    assert app["_verify_sync"]("elsewhere", _stored(app, "carol"))[0]
+
+
+def test_concurrent_registrations_admit_one(any_app):
+    user = f"dave-{os.urandom(4).hex()}"   # the PostgreSQL run shares its database
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda i: any_app["register_user"](user, f"secret-{i}", f"10.0.0.{i}"), range(4)))
+    try:
+        assert sorted(ok for ok, _ in results) == [False, False, False, True]
+        winner = next(i for i, (ok, _) in enumerate(results) if ok)
+        assert any_app["login_user"](user, f"secret-{winner}", "10.0.0.9") == (True, "ok")
+    finally:
+        with any_app["engine"].begin() as con:
+            con.execute(text("DELETE FROM users WHERE username=:u"), {"u": user})
+
+
+def _session_rows(app, token):
+    with app["engine"].connect() as con:
+        return con.execute(text("SELECT COUNT(*) FROM sessions WHERE token=:t"),
+                           {"t": app["_token_key"](token)}).scalar()
+
+
+def test_rotated_sid_is_dead(app):
+    old = app["create_session"]("erin")
+    user, new = app["rotate_session"](old)
+    assert user == "erin" and new != old
+    assert app["session_user"](old) is None and app["rotate_session"](old) == (None, None)
+    assert app["session_user"](new) == "erin"
+
+
+def test_expired_sid_is_rejected(app):
+    token = app["create_session"]("erin")
+    with app["engine"].begin() as con:
+        con.execute(text("UPDATE sessions SET expires = expires - :ttl - 1"), {"ttl": app["SESSION_TTL"]})
+    assert app["session_user"](token) is None and app["rotate_session"](token) == (None, None)
+    app["create_session"]("frank")           # the next sign-in sweeps expired rows
+    assert _session_rows(app, token) == 0
+
+
+def test_logout_deletes_the_session_row(app):
+    token = app["create_session"]("erin")
+    assert _session_rows(app, token) == 1
+    app["end_session"](token)
+    assert _session_rows(app, token) == 0 and app["session_user"](token) is None
@@ -0,0 +1,74 @@
+"""Batch valuation and the prediction cache must price exactly like the per-row path.
+house_model.pkl is not shipped, so a small regressor is fitted on the shipped feature
+columns instead."""
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ROOT
+
+pytest.importorskip("sklearn")
+from sklearn.tree import DecisionTreeRegressor
+
+
+@pytest.fixture
+def scored_app(app):
+    g = app["predict_batch"].__globals__
+    g["MODEL_COLS"] = list(joblib.load(os.path.join(ROOT, "model_columns.pkl")))
+    X = pd.DataFrame(np.random.default_rng(0).random((200, len(g["MODEL_COLS"]))),
+                     columns=g["MODEL_COLS"])
+    g["model"] = DecisionTreeRegressor(max_depth=6, random_state=0).fit(X, X.sum(axis=1) * 1e6)
+    return g
+
+
+def test_batch_matches_per_row(scored_app):
+    g  = scored_app
+    df = g["synthetic_properties"](300, seed=1)
+    loop  = [g["model"].predict(g["build_input"](r))[0] for r in df.to_dict("records")]
+    batch = g["predict_batch"](df)["predicted_price"].to_numpy()
+    np.testing.assert_allclose(batch, loop)
+
+
+def test_benchmark_reports_rates(scored_app):
+    b = scored_app["benchmark_batch"](2_000, 100)
+    assert b["rows"] == 2_000
+    assert b["loop_rows_per_s"] > 0 and b["batch_rows_per_s"] > 0
+    assert b["speedup"] == pytest.approx(b["batch_rows_per_s"] / b["loop_rows_per_s"])
+
+
+def _fresh(g, inp):
+    return float(g["model"].predict(g["build_input"](inp))[0])
+
+
+def test_cache_hit_prices_like_a_fresh_predict(scored_app):
+    g = scored_app
+    for inp in g["synthetic_properties"](20, seed=2).to_dict("records"):
+        price, cached = g["predict_one"](inp)
+        assert not cached and price == _fresh(g, inp)
+        assert g["predict_one"](inp) == (price, True)
+
+
+def test_shared_cache_hit_prices_like_a_fresh_predict(scored_app):
+    g   = scored_app
+    inp = g["synthetic_properties"](1, seed=3).to_dict("records")[0]
+    g["prediction_cache"] = g["PredictionCache"](shared=True)
+    price, _ = g["predict_one"](inp)
+    g["prediction_cache"] = g["PredictionCache"](shared=True)   # another process: empty LRU
+    assert g["predict_one"](inp) == (price, True) and g["prediction_cache"].shared_hits == 1
+    assert price == _fresh(g, inp)
+
+
+def test_new_model_version_misses_the_cache(scored_app):
+    g   = scored_app
+    inp = g["synthetic_properties"](1, seed=4).to_dict("records")[0]
+    old, _ = g["predict_one"](inp)
+    X = pd.DataFrame(np.random.default_rng(1).random((200, len(g["MODEL_COLS"]))), columns=g["MODEL_COLS"])
+    g["model"] = DecisionTreeRegressor(max_depth=6, random_state=0).fit(X, X.sum(axis=1) * 2e6)
+    g["MODEL_VERSION"] = "v-next"
+    price, cached = g["predict_one"](inp)
+    assert not cached and price == _fresh(g, inp) != old
+    assert g["predict_one"](inp) == (price, True)
+
@@ -0,0 +1,13 @@
+"""Dashboard tabs: the Admin tab is only shown to users listed in ADMIN_USERS."""
+from conftest import load_app
+
+
+def test_admin_tab_needs_listing(app):
+    assert not app["ADMIN_USERS"] and not app["IS_ADMIN"]
+    assert "Admin" not in "".join(app["TAB_NAMES"])
+
+
+def test_admin_users_are_parsed_from_the_environment(tmp_path, monkeypatch):
+    for app in load_app(tmp_path, monkeypatch, ADMIN_USERS=" ops, alice ,,"):
+        assert app["ADMIN_USERS"] == {"ops", "alice"}
+        assert not app["IS_ADMIN"]   # nobody is signed in
@@ -0,0 +1,94 @@
+"""Pincode and city resolution against a local stub standing in for zippopotam.us and
+Nominatim: local gazetteer -> geocode cache (LRU, then table) -> one upstream call per
+distinct miss, with "not found" cached and upstream errors not."""
+import pytest
+
+from conftest import load_app
+
+UNKNOWN_PIN  = "999001"
+UNKNOWN_CITY = "Xqjvwz"
+
+
+def _upstream(path):
+    if path.startswith("/zip/IN/999001"):
+        return 200, {"places": [{"place name": "Stubville", "state": "Goa",
+                                 "latitude": "15.5", "longitude": "73.8"}]}, {}, 0
+    if path.startswith("/zip/"):
+        return 404, {}, {}, 0
+    if path.startswith("/nom/search") and "Xqjvwz" in path:
+        return 200, [{"lat": "10.25", "lon": "76.5"}], {}, 0
+    return 200, [], {}, 0
+
+
+@pytest.fixture
+def geo(tmp_path, monkeypatch, stub_server):
+    stub_server.respond = _upstream
+    for app in load_app(tmp_path, monkeypatch, ZIPPOPOTAM_URL=stub_server.url + "/zip",
+                        NOMINATIM_URL=stub_server.url + "/nom"):
+        g = app["lookup_pincodes"].__globals__
+        client = g["HttpClient"](retries=0, backoff=0.01, fail_threshold=2, cooldown=60)
+        g["http_client"] = client   # the app's Nominatim pacing (1 req/s) would only slow tests down
+        yield g
+
+
+def _fresh_process(g):
+    """Drop the in-process LRU, as another app process would start without it."""
+    g["geo_cache"] = g["GeoCache"]()
+
+
+def test_local_gazetteer_needs_no_network(geo, stub_server):
+    assert geo["lookup_pincode"]("400001")["city"] == "Mumbai"
+    assert geo["geocode_address"]("Pune", "Maharashtra", "India") == (18.5196, 73.8553)
+    assert stub_server.hits == []
+
+
+def test_upstream_hit_is_cached_in_memory_and_table(geo, stub_server):
+    hit = geo["lookup_pincode"](UNKNOWN_PIN)
+    assert hit == {"city": "Stubville", "state": "Goa", "lat": 15.5, "lon": 73.8}
+    assert geo["lookup_pincode"](UNKNOWN_PIN) == hit
+    _fresh_process(geo)
+    assert geo["lookup_pincode"](UNKNOWN_PIN) == hit
+    assert stub_server.hits == [f"/zip/IN/{UNKNOWN_PIN}"]
+
+
+def test_not_found_is_cached(geo, stub_server):
+    assert geo["lookup_pincode"]("999404") == {}
+    _fresh_process(geo)
+    assert geo["lookup_pincode"]("999404") == {}
+    assert len(stub_server.hits) == 1
+
+
+def test_upstream_errors_are_not_cached(geo, stub_server):
+    stub_server.respond = lambda path: (503, {}, {}, 0)
+    assert geo["lookup_pincode"](UNKNOWN_PIN) == {}
+    stub_server.respond = _upstream
+    assert geo["lookup_pincode"](UNKNOWN_PIN)["city"] == "Stubville"
+    assert len(stub_server.hits) == 2
+
+
+def test_batch_deduplicates_and_resolves_each_tier(geo, stub_server):
+    out = geo["lookup_pincodes"]([UNKNOWN_PIN, "400001", UNKNOWN_PIN, " 999404 ", "999404"])
+    assert out[UNKNOWN_PIN]["city"] == "Stubville"
+    assert out["400001"]["city"] == "Mumbai"
+    assert out["999404"] == {}
+    assert sorted(stub_server.hits) == ["/zip/IN/999001", "/zip/IN/999404"]
+
+
+def test_geocode_chain(geo, stub_server):
+    places = [("Mumbai", "", "India"), (UNKNOWN_CITY, "Kerala", "India"), (UNKNOWN_CITY, "Kerala", "India")]
+    assert geo["geocode_many"](places, network=False) == {("Mumbai", "", "India"): (18.9388, 72.8354)}
+    out = geo["geocode_many"](places)
+    assert out[(UNKNOWN_CITY, "Kerala", "India")] == (10.25, 76.5)
+    assert len(stub_server.hits) == 1
+    _fresh_process(geo)
+    assert geo["geocode_many"](places, network=False) == out   # now answered by the cache table
+    assert geo["geocode_address"]("Nowhere Qq", "", "India") == (0.0, 0.0)
+
+
+def test_open_breaker_degrades_to_unresolved(geo, stub_server):
+    stub_server.respond = lambda path: (500, {}, {}, 0)
+    for pin in ("999101", "999102"):
+        assert geo["lookup_pincode"](pin) == {}
+    assert geo["lookup_pincode"]("999103") == {}   # short-circuited, no request sent
+    assert len(stub_server.hits) == 2
+    assert geo["http_client"].stats().iloc[0]["state"] == "open"
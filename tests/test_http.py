@@ -0,0 +1,110 @@
+"""HttpClient against a local stub server: retries, Retry-After and the circuit
+breaker's closed -> open -> half-open -> closed cycle."""
+import threading
+import time
+
+import pytest
+import requests
+
+
+@pytest.fixture
+def client(app):
+    return app["HttpClient"](retries=0, backoff=0.01, fail_threshold=2, cooldown=0.3)
+
+
+def _state(client):
+    return client.stats().iloc[0]["state"]
+
+
+def test_success_keeps_breaker_closed(client, stub_server):
+    assert client.get(stub_server.url + "/ok").status_code == 200
+    assert _state(client) == "closed"
+
+
+def test_5xx_opens_then_half_open_probe_closes(client, stub_server, app):
+    stub_server.respond = lambda path: (503 if path == "/down" else 200, {}, {}, 0)
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.get(stub_server.url + "/down")
+    assert _state(client) == "open"
+    with pytest.raises(app["CircuitOpenError"]):   # fails fast, the upstream is not called
+        client.get(stub_server.url + "/ok")
+    assert stub_server.hits == ["/down", "/down"]
+
+    time.sleep(0.35)
+    assert _state(client) == "half-open"
+    assert client.get(stub_server.url + "/ok").status_code == 200
+    assert _state(client) == "closed"
+    assert client.stats().iloc[0]["short_circuits"] == 1
+
+
+def test_failed_probe_reopens_at_once(client, stub_server, app):
+    stub_server.respond = lambda path: (500, {}, {}, 0)
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.get(stub_server.url + "/down")
+    time.sleep(0.35)
+    with pytest.raises(requests.HTTPError):        # the single probe fails …
+        client.get(stub_server.url + "/down")
+    assert _state(client) == "open"                # … and one failure is enough to reopen
+    with pytest.raises(app["CircuitOpenError"]):
+        client.get(stub_server.url + "/down")
+
+
+def test_half_open_admits_a_single_probe(client, stub_server, app):
+    stub_server.respond = lambda path: (500, {}, {}, 0) if path == "/down" else (200, {}, {}, 0.3)
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.get(stub_server.url + "/down")
+    time.sleep(0.35)
+    probe = threading.Thread(target=client.get, args=(stub_server.url + "/slow",))
+    probe.start()
+    time.sleep(0.1)
+    with pytest.raises(app["CircuitOpenError"]):   # a second caller while the probe is in flight
+        client.get(stub_server.url + "/slow")
+    probe.join()
+    assert _state(client) == "closed"
+    assert stub_server.hits.count("/slow") == 1
+
+
+def test_timeouts_count_as_failures(client, stub_server, app):
+    stub_server.respond = lambda path: (200, {}, {}, 0.5)
+    for _ in range(2):
+        with pytest.raises(requests.Timeout):
+            client.get(stub_server.url + "/slow", timeout=0.1)
+    assert _state(client) == "open"
+    assert client.stats().iloc[0]["errors"] == 2
+    with pytest.raises(app["CircuitOpenError"]):
+        client.get(stub_server.url + "/slow", timeout=0.1)
+
+
+def test_429_waits_for_retry_after(app, stub_server):
+    client = app["HttpClient"](retries=1, backoff=0.01, fail_threshold=2, cooldown=0.3)
+    stub_server.respond = lambda path: ((429, {}, {"Retry-After": "1"}, 0) if len(stub_server.hits) == 1
+                                        else (200, {}, {}, 0))
+    t0 = time.monotonic()
+    assert client.get(stub_server.url + "/limited").status_code == 200
+    assert time.monotonic() - t0 >= 1.0
+    stats = client.stats().iloc[0]
+    assert (stats["retries"], stats["errors"], stats["state"]) == (1, 1, "closed")
+
+
+def test_429_with_long_retry_after_gives_up_at_once(app, stub_server):
+    client = app["HttpClient"](retries=3, backoff=0.01, fail_threshold=1, cooldown=0.3,
+                               max_retry_after=1.0)
+    stub_server.respond = lambda path: (429, {}, {"Retry-After": "120"}, 0)
+    t0 = time.monotonic()
+    with pytest.raises(requests.HTTPError):
+        client.get(stub_server.url + "/limited")
+    assert time.monotonic() - t0 < 1.0 and len(stub_server.hits) == 1
+    assert _state(client) == "open"
+    with pytest.raises(app["CircuitOpenError"]):
+        client.get(stub_server.url + "/limited")
+
+
+def test_retry_after_http_date(app):
+    r = requests.Response()
+    r.headers["Retry-After"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert app["_retry_after"](r) == 0.0
+    r.headers["Retry-After"] = "soon"
+    assert app["_retry_after"](r) is None
@@ -0,0 +1,70 @@
+"""Login rate limiting: per-pair lockout, the known-good-client exemption and shared
+state between processes (two limiters on one database stand in for two workers)."""
+import pytest
+from sqlalchemy import text
+
+
+def _fail(limiter, user, client, times):
+    for _ in range(times):
+        allowed, _ = limiter.check(user, client)
+        assert allowed
+        limiter.record(user, client, False)
+
+
+def test_pair_is_locked_out_after_repeated_failures(app):
+    limiter = app["LoginLimiter"](shared=False)
+    _fail(limiter, "alice", "10.0.0.1", 5)
+    allowed, wait = limiter.check("alice", "10.0.0.1")
+    assert not allowed and wait > app["LOCKOUT_BASE"] - 1
+    assert limiter.stats()["locked"] >= 1
+
+
+def test_known_good_client_skips_the_user_bucket(app):
+    limiter = app["LoginLimiter"](shared=False)
+    assert limiter.check("alice", "10.0.0.1")[0]
+    limiter.record("alice", "10.0.0.1", True)
+    for i in range(5):                     # someone else drains alice's per-user bucket
+        limiter.check("alice", f"203.0.113.{i}")
+    assert not limiter.check("alice", "203.0.113.99")[0]
+    assert limiter.check("alice", "10.0.0.1")[0]
+
+
+def test_success_resets_failures(app):
+    limiter = app["LoginLimiter"](shared=False)
+    _fail(limiter, "alice", "10.0.0.1", 3)
+    limiter.record("alice", "10.0.0.1", True)
+    _fail(limiter, "alice", "10.0.0.1", 4)   # would have locked without the reset
+    assert limiter.check("alice", "10.0.0.1")[0]
+
+
+@pytest.fixture
+def shared_app(any_app):
+    with any_app["engine"].begin() as con:   # PostgreSQL scratch DBs outlive a test
+        con.execute(text("DELETE FROM login_limits"))
+    return any_app
+
+
+def test_shared_lockout_reaches_other_processes(shared_app):
+    app = shared_app
+    a = app["LoginLimiter"](shared=True)
+    b = app["LoginLimiter"](shared=True)
+    _fail(b, "bob", "10.0.0.2", 1)            # b holds its own, soon stale, entries
+    _fail(a, "bob", "10.0.0.2", 4)            # the shared count reaches 5 in a
+    allowed, wait = b.check("bob", "10.0.0.2")
+    assert not allowed and wait > app["LOCKOUT_BASE"] - 1
+    with app["engine"].connect() as con:
+        failures, locked_until = con.execute(text(
+            "SELECT failures, locked_until FROM login_limits WHERE key = 'pair:10.0.0.2:bob'")).one()
+    assert failures == 5 and locked_until > 0   # b's writes did not undo a's lockout
+
+
+def test_shared_save_never_shortens_a_lockout(shared_app):
+    app = shared_app
+    a = app["LoginLimiter"](shared=True)
+    b = app["LoginLimiter"](shared=True)
+    _fail(b, "carol", "10.0.0.3", 2)
+    _fail(a, "carol", "10.0.0.3", 3)           # a sees b's 2 failures, so this locks
+    b.record("carol", "10.0.0.3", False)       # b writes its own view afterwards
+    assert not a.check("carol", "10.0.0.3")[0]
+    assert not b.check("carol", "10.0.0.3")[0]
+    assert not app["LoginLimiter"](shared=True).check("carol", "10.0.0.3")[0]
@@ -0,0 +1,82 @@
+"""Thumbnails are written through a tmp file that never outlives a failed save; uploads
+are linked to their valuation by the writer's row id, or removed if it was not saved."""
+import io
+import os
+import time
+from concurrent.futures import Future
+
+import pytest
+from PIL import Image
+from sqlalchemy import text
+
+from test_storage import _sample_input
+
+
+def _png():
+    buf = io.BytesIO()
+    Image.new("RGB", (800, 600), "teal").save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _leftovers(app):
+    return [n for n in os.listdir(app["THUMB_DIR"]) if n.endswith(".tmp")]
+
+
+def test_thumbnail_is_bounded_and_stored_once(app):
+    digest, name = app["make_thumbnail"](_png())
+    path = os.path.join(app["THUMB_DIR"], name)
+    with Image.open(path) as im:
+        assert im.format == "WEBP" and max(im.size) <= max(app["THUMB_SIZE"])
+    assert app["make_thumbnail"](_png()) == (digest, name)
+    assert _leftovers(app) == []
+
+
+def test_failed_save_leaves_no_tmp(app, monkeypatch):
+    data = _png()
+
+    def half_written(self, fp, *args, **kwargs):
+        with open(fp, "wb") as f:
+            f.write(b"RIFF")
+        raise OSError("disk full")
+    monkeypatch.setattr(Image.Image, "save", half_written)
+    with pytest.raises(OSError, match="disk full"):
+        app["make_thumbnail"](data)
+    assert os.listdir(app["THUMB_DIR"]) == []
+
+
+class _Upload(io.BytesIO):
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name, self.size = name, len(data)
+
+
+def _usage(app, user):
+    with app["engine"].connect() as con:
+        return con.execute(text("SELECT bytes FROM media_usage WHERE username=:u"), {"u": user}).scalar()
+
+
+def test_media_is_linked_by_the_saved_row_id(app):
+    saved = app["save_prediction"]("media-test", _sample_input(), 4_500_000.0, "Mid-Range", 18.52, 73.85)
+    pid = saved.result(10)
+    assert isinstance(pid, int)
+    names, rejected = app["ingest_media"]("media-test", [_Upload("front.png", _png())], saved).result(10)
+    assert rejected == [] and len(names) == 1
+    with app["engine"].connect() as con:
+        assert con.execute(text("SELECT prediction_id FROM media WHERE name=:n"), {"n": names[0]}).scalar() == pid
+
+
+def test_unsaved_valuation_refunds_and_removes_new_files(app):
+    saved, data = Future(), _png()
+    job = app["ingest_media"]("media-test", [_Upload("front.png", data)], saved)
+    deadline = time.monotonic() + 10
+    while not os.listdir(app["THUMB_DIR"]) and time.monotonic() < deadline:   # stored and described
+        time.sleep(0.05)
+    assert len(os.listdir(app["MEDIA_DIR"])) == 1 and _usage(app, "media-test") == len(data)
+    # Stored and waiting on the row id, yet every background worker is free.
+    busy = [app["background"].submit(time.sleep, 0) for _ in range(8)]
+    assert all(f.result(5) is None for f in busy) and not job.done()
+    saved.set_result(None)   # the writer dead-lettered the row
+    names, rejected = job.result(10)
+    assert names == [] and rejected == [("front.png", "the valuation was not saved")]
+    assert _usage(app, "media-test") == 0
+    assert os.listdir(app["MEDIA_DIR"]) == [] and os.listdir(app["THUMB_DIR"]) == []
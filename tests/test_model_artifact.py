@@ -0,0 +1,71 @@
+"""The mmap-able model artifact must predict exactly like the sklearn estimator it
+was exported from, on both the flat path (small inputs) and the batch path."""
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("sklearn")
+from sklearn.ensemble import ExtraTreesRegressor, GradientBoostingRegressor, RandomForestRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+from conftest import ROOT
+
+COLS = list(joblib.load(os.path.join(ROOT, "model_columns.pkl")))
+FLAGS = [c for c in COLS if c not in ("area", "bedrooms", "bathrooms", "stories", "parking")]
+
+
+def _data(n, seed):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.integers(1, 6, (n, len(COLS))).astype(float), columns=COLS)
+    X["area"] = rng.uniform(300, 8000, n)
+    X[FLAGS] = rng.random((n, len(FLAGS))) < 0.5
+    return X, X["area"] * 3_000 + X["bedrooms"] * 250_000 + X[FLAGS].sum(axis=1) * 100_000
+
+
+ESTIMATORS = {
+    "tree": lambda: DecisionTreeRegressor(max_depth=12, random_state=0),
+    "rf":   lambda: RandomForestRegressor(n_estimators=25, random_state=0),
+    "et":   lambda: ExtraTreesRegressor(n_estimators=25, random_state=0),
+    "gbr":  lambda: GradientBoostingRegressor(n_estimators=60, random_state=0),
+}
+
+
+@pytest.fixture(params=list(ESTIMATORS))
+def fitted(request, tmp_path):
+    X, y = _data(800, 0)
+    est = ESTIMATORS[request.param]().fit(X, y)
+    path = tmp_path / "model.pkl"
+    joblib.dump(est, path)
+    return est, str(path)
+
+
+def test_flat_model_matches_sklearn(app, fitted):
+    est, _ = fitted
+    flat = app["FlatTreeModel"].from_sklearn(est)   # no source: every size takes the flat walk
+    X, _ = _data(500, 1)
+    np.testing.assert_allclose(flat.predict(X), est.predict(X), rtol=1e-9)
+    np.testing.assert_allclose(flat.predict(X.head(1)), est.predict(X.head(1)), rtol=1e-9)
+
+
+def test_artifact_matches_sklearn_on_both_paths(app, fitted):
+    est, path = fitted
+    model = app["load_model_artifact"](path, mmap=True, cols=COLS)
+    assert isinstance(model, app["FlatTreeModel"]) and model.source == path
+    small, _ = _data(app["MODEL_FLAT_MAX_ROWS"], 2)
+    big, _   = _data(2_000, 3)
+    np.testing.assert_allclose(model.predict(small), est.predict(small), rtol=1e-9)
+    assert model._estimator is None                 # single valuations never load the pickle
+    np.testing.assert_allclose(model.predict(big), est.predict(big), rtol=1e-9)
+    assert model._estimator is not None
+
+
+def test_flag_columns_come_from_the_names(app, tmp_path):
+    cols = FLAGS + ["area", "bedrooms", "bathrooms", "stories", "parking"]   # flags first
+    X, y = _data(800, 0)
+    est = RandomForestRegressor(n_estimators=10, random_state=0).fit(X[cols].to_numpy(), y)
+    path = tmp_path / "reordered.pkl"
+    joblib.dump(est, path)
+    assert app["export_model_artifact"](str(path), cols).endswith(".flat")
@@ -0,0 +1,35 @@
+"""Which version the model registry picks as the newest."""
+import pytest
+
+
+@pytest.fixture
+def registry(app, tmp_path):
+    def make(*versions, pinned=None):
+        root = tmp_path / "models"
+        for v in versions:
+            (root / v).mkdir(parents=True)
+            (root / v / "meta.json").write_text("{}")
+        if pinned:
+            (root / "CURRENT").write_text(pinned + "\n")
+        return app["ModelRegistry"](root=str(root), poll_secs=3600)
+    return make
+
+
+@pytest.mark.parametrize("versions, latest", [
+    (["v9", "v10", "v2"], "v10"),
+    (["1.9.0", "1.10.0", "1.2.11"], "1.10.0"),
+    (["20260901", "20261018", "20251231"], "20261018"),
+    (["rf-v9", "rf-v10", "gbm-v3"], "rf-v10"),
+])
+def test_latest_compares_numbers_numerically(registry, versions, latest):
+    assert registry(*versions).latest_version() == latest
+
+
+def test_folder_without_meta_is_ignored(registry, tmp_path):
+    reg = registry("v2")
+    (tmp_path / "models" / "v3").mkdir()   # still being written
+    assert reg.latest_version() == "v2"
+
+
+def test_current_file_pins_a_version(registry):
+    assert registry("v9", "v10", pinned="v9").latest_version() == "v9"